@@ -3,16 +3,153 @@ import numpy as np
 import glob
 import copy
 import re
+import os
+import pickle
+import hashlib
 from psPlotKit.util import logger
-from psPlotKit.data_manager.ps_data import PsData, CustomUnits
-import difflib
+from psPlotKit.data_manager.ps_data import (
+    PsData,
+    get_default_units,
+    LazyArray,
+    LazyLoadBudget,
+    read_rows,
+)
+from psPlotKit.data_manager.ps_key_index import FuzzyKeyIndex
+from psPlotKit.data_manager.json_stream import JsonStreamFile, JsonValue
+from psPlotKit.data_manager.h5_handle_pool import PooledDataset, get_default_pool
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 __author__ = "Alexander V. Dudchenko "
 
 _logger = logger.define_logger(__name__, "PsDataImport", level="INFO")
 
+# bump when the structure of the file index changes to invalidate old caches
+_INDEX_CACHE_VERSION = 2
+# bytes read from start and end of the data file for the cache content hash
+_INDEX_HASH_BLOCK_SIZE = 1024 * 1024
+_INDEX_ATTRIBUTES = [
+    "directories",
+    "file_index",
+    "directory_indexes",
+    "global_unique_directories",
+    "sub_contents",
+    "unique_data_keys",
+    "directory_key_map",
+]
+
+
+def _get_varying_components(key_arr):
+    """returns dict of path depth -> set of path components that vary between
+    directories of that depth, for single component paths all components are
+    returned, computed with one sort per depth instead of per directory"""
+    directories_by_depth = {}
+    for keys in key_arr:
+        directories_by_depth.setdefault(len(keys), []).append(keys)
+    varying_components = {}
+    for depth, group in directories_by_depth.items():
+        if depth == 1:
+            varying_components[depth] = {keys[0] for keys in group}
+        else:
+            components = np.array(group, dtype=str).reshape(len(group), depth)
+            sorted_components = np.sort(components, axis=0)
+            varying_columns = sorted_components[0] != sorted_components[-1]
+            varying_components[depth] = set(
+                np.unique(components[:, varying_columns]).tolist()
+            )
+    return varying_components
+
+
+def _get_feasible_rows(feasible_mask, row_indexes):
+    """returns the feasibility of the selected rows, rows the mask does not
+    cover yet (e.g. solve_successful lags behind data in SWMR files) are
+    infeasible"""
+    if not isinstance(feasible_mask, np.ndarray):
+        # directory has no mask
+        return feasible_mask
+    feasible = np.zeros(len(row_indexes), dtype=bool)
+    covered = row_indexes < len(feasible_mask)
+    feasible[covered] = feasible_mask[row_indexes[covered]]
+    return feasible
+
+
+def _get_row_selection(rows, num_rows):
+    """converts a row selection (slice, boolean mask or list of indexes) into a
+    slice or increasing index array, slices are read by h5py as a hyperslab,
+    index arrays are read with read_rows"""
+    if rows is None:
+        return ()
+    if isinstance(rows, slice):
+        if rows.step is not None and rows.step < 0:
+            raise ValueError("Row selection step must be positive, got {}".format(rows))
+        return slice(*rows.indices(num_rows))
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        if len(rows) != num_rows:
+            raise ValueError(
+                "Boolean row selection has {} rows, data has {} rows".format(
+                    len(rows), num_rows
+                )
+            )
+        rows = np.flatnonzero(rows)
+    else:
+        if rows.size > 0 and rows.dtype.kind not in "iu":
+            raise ValueError(
+                "Row indexes must be integers, got {} indexes".format(rows.dtype)
+            )
+        rows = rows.astype(np.intp).ravel()
+        out_of_range = (rows < -num_rows) | (rows >= num_rows)
+        if out_of_range.any():
+            raise ValueError(
+                "Row indexes {} are out of range for data with {} rows".format(
+                    rows[out_of_range].tolist(), num_rows
+                )
+            )
+        rows = np.unique(np.where(rows < 0, rows + num_rows, rows))
+    # contiguous rows are read as a single slice
+    if len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows):
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+
+def _list_to_array(data):
+    """converts json data to an array the way PsData converts lists, null
+    values become NaN and non numeric data becomes str"""
+    if not isinstance(data, list):
+        return np.asarray(data)
+    try:
+        return np.array(data, dtype=float)
+    except (TypeError, ValueError):
+        return np.array(data, dtype=str)
+
+
+class _ImportedDataset:
+    """dataset of a PsDataImport referenced by path and read from the
+    current file of the import, so lazy data does not hold h5py datasets"""
+
+    __slots__ = ("importer", "name")
+
+    def __init__(self, importer, name):
+        self.importer = importer
+        self.name = name
+
+    @property
+    def shape(self):
+        return self.importer.data_file[self.name].shape
+
+    def __getitem__(self, selection):
+        return self.importer.data_file[self.name][selection]
+
+    def __reduce__(self):
+        # sent without the import, the receiving process opens the file
+        # through its default pool
+        pool = get_default_pool()
+        location = self.importer.h5_fileLocation
+        pool.set_file_options(location, **self.importer._get_h5_file_options())
+        return (PooledDataset, (pool, location, self.name))
+
 
 class PsDataImport:
     def __init__(
@@ -21,10 +158,59 @@ class PsDataImport:
         group_keys=["outputs"],
         data_keys=["values", "value"],
         default_return_directory=None,
+        lazy_load=False,
+        memory_budget=None,
+        index_cache=False,
+        stream_json=False,
+        swmr=False,
+        handle_pool=None,
+        chunk_cache=None,
+        storage_dtype=None,
     ):
+        """
+        data_location: path to .h5 or .json file
+        group_keys: keys that identify a terminal data directory
+        data_keys: keys under which data values are stored
+        default_return_directory: (optional) directory label added to all imported data
+        lazy_load: (optional) if True, h5 datasets are not read on import, each PsData
+            keeps a handle to its dataset and reads it on first access of its data
+        memory_budget: (optional) max bytes of lazily loaded data to keep in memory,
+            oldest loaded data is released and re-read on next access, can be
+            a LazyLoadBudget to share one budget between multiple files
+        index_cache: (optional) if True, the file index is saved next to the data file
+            as <data_location>.psindex and reused on next import as long as the file
+            path, size, mtime and content hash are unchanged, if a path is provided
+            cache files are stored in that folder instead
+        stream_json: (optional) if True, .json files are not loaded with json.load, only
+            their structure is read and arrays are parsed from the file when
+            imported, so memory use scales with the imported keys and not the file size
+        swmr: (optional) if True, .h5 files are opened in single writer multiple reader
+            mode so files that are still being written (with swmr_mode enabled) can be
+            read, dataset extents are refreshed on every read and keys that are only
+            partially written are skipped until the next refresh
+        handle_pool: (optional) H5HandlePool shared between imports, .h5 files are opened
+            through the pool, which limits the number of open files and closes the least
+            recently used file, files are re-opened transparently on next access
+        chunk_cache: (optional) dict with h5py chunk cache options for this file
+            (rdcc_nbytes, rdcc_nslots, rdcc_w0), e.g. {"rdcc_nbytes": 64 * 1024**2}
+        storage_dtype: (optional) dtype imported float data is stored as, e.g. "float32",
+            can be set per key with a 'storage_dtype' entry
+        """
         _logger.info("data import v0.3")
         _logger.info("Importing file {}".format(data_location))
         self.default_return_directory = default_return_directory
+        self.data_location = data_location
+        self.index_cache = index_cache
+        self.lazy_load = lazy_load
+        self.stream_json = stream_json
+        self.swmr = swmr
+        self.handle_pool = handle_pool
+        self.chunk_cache = chunk_cache
+        self.storage_dtype = storage_dtype
+        if memory_budget is None or isinstance(memory_budget, LazyLoadBudget):
+            self.memory_budget = memory_budget
+        else:
+            self.memory_budget = LazyLoadBudget(memory_budget)
         if ".h5" in data_location:
             self.h5_fileLocation = data_location
             self.get_h5_file(self.h5_fileLocation)
@@ -33,6 +219,9 @@ class PsDataImport:
             self.json_fileLocation = data_location
             self.get_json_file(self.json_fileLocation)
             self.h5_mode = False
+            if self.lazy_load:
+                _logger.info("Lazy loading is only supported for .h5 files")
+                self.lazy_load = False
         else:
             raise ImportError(
                 "File type provided is not supported. Please provide .json or .h5 file format"
@@ -45,63 +234,203 @@ class PsDataImport:
 
         self.file_index = {}
         self.directory_indexes = {}
-        self.get_file_directories()
-        self.get_directory_contents()
+        self._key_search_index = None
+        """ feasibility mask per directory, shared by all data in directory """
+        self._feasible_masks = {}
+        if not self._load_index_cache():
+            with self._use_file():
+                self.get_file_directories()
+                self.get_directory_contents()
+            self._save_index_cache()
         self.directory_keys = []
         self.only_feasible = True
         """ specified cut off for searching for near keys """
         self.search_cut_off = 0.6
         """ number of near keys to return """
         self.num_keys = 1
-        self.custom_units = CustomUnits()
+        self.custom_units = get_default_units()
+
+    def _get_index_cache_path(self):
+        if self.index_cache is True:
+            return self.data_location + ".psindex"
+        file_id = hashlib.sha1(os.path.abspath(self.data_location).encode()).hexdigest()
+        return os.path.join(self.index_cache, file_id + ".psindex")
+
+    def _get_file_signature(self):
+        """signature used to validate index cache, content hash is computed from
+        the start and end of the file so large files are not read in full"""
+        stat = os.stat(self.data_location)
+        digest = hashlib.sha1()
+        with open(self.data_location, "rb") as f:
+            digest.update(f.read(_INDEX_HASH_BLOCK_SIZE))
+            if stat.st_size > 2 * _INDEX_HASH_BLOCK_SIZE:
+                f.seek(-_INDEX_HASH_BLOCK_SIZE, os.SEEK_END)
+            digest.update(f.read(_INDEX_HASH_BLOCK_SIZE))
+        return {
+            "version": _INDEX_CACHE_VERSION,
+            "path": os.path.abspath(self.data_location),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest.hexdigest(),
+            "group_keys": list(self.group_keys),
+            "data_keys": list(self.data_keys),
+        }
+
+    def _load_index_cache(self):
+        """load file index from cache, returns False if cache is disabled, missing
+        or out of date"""
+        if not self.index_cache:
+            return False
+        cache_path = self._get_index_cache_path()
+        if not os.path.exists(cache_path):
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            _logger.info("Could not read index cache {}: {}".format(cache_path, e))
+            return False
+        if cache.get("signature") != self._get_file_signature():
+            _logger.info("Index cache {} is out of date".format(cache_path))
+            return False
+        for attr in _INDEX_ATTRIBUTES:
+            setattr(self, attr, cache["index"][attr])
+        _logger.info("Loaded file index from cache {}".format(cache_path))
+        return True
+
+    def _save_index_cache(self):
+        if not self.index_cache:
+            return
+        cache_path = self._get_index_cache_path()
+        cache = {
+            "signature": self._get_file_signature(),
+            "index": {attr: getattr(self, attr) for attr in _INDEX_ATTRIBUTES},
+        }
+        try:
+            if os.path.dirname(cache_path) != "":
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "wb") as f:
+                pickle.dump(cache, f)
+            _logger.info("Saved file index cache {}".format(cache_path))
+        except OSError as e:
+            _logger.info("Could not save index cache {}: {}".format(cache_path, e))
+
+    def refresh(self):
+        """re-opens the data file and re-scans it for directories and keys that
+        were added since it was imported, e.g. by a sweep that is still running,
+        returns list of new directories. Use get_data(refresh=True) to read the
+        new data into a PsDataManager."""
+        known_directories = set(self.directories)
+        if self.h5_mode and self.swmr:
+            # swmr handle stays valid, dataset extents are refreshed on read
+            pass
+        elif self.h5_mode and self.handle_pool is not None:
+            # pooled file is re-opened on next access
+            self.handle_pool.close(self.h5_fileLocation)
+        elif self.h5_mode:
+            # handles of lazily imported data keep the old file open until they
+            # are replaced by get_data(refresh=True)
+            self.get_h5_file(self.h5_fileLocation)
+        else:
+            self.get_json_file(self.json_fileLocation)
+        self.file_index = {}
+        self.directory_indexes = {}
+        self._key_search_index = None
+        self._feasible_masks = {}
+        if not self._load_index_cache():
+            with self._use_file():
+                self.get_file_directories()
+                self.get_directory_contents()
+            self._save_index_cache()
+        new_directories = [d for d in self.directories if d not in known_directories]
+        _logger.info(
+            "Refreshed {}, found {} new directories".format(
+                self.data_location, len(new_directories)
+            )
+        )
+        return new_directories
 
     def _perform_data_tests(self, directory_contents):
+        if hasattr(directory_contents, "keys"):
+            directory_contents = directory_contents.keys()
         termination_test = any(
-            [term_key in directory_contents.keys() for term_key in self.group_keys]
-        )
-        data_test = any(
-            [term_key in directory_contents.keys() for term_key in self.data_keys]
+            [term_key in directory_contents for term_key in self.group_keys]
         )
+        data_test = any([term_key in directory_contents for term_key in self.data_keys])
         return termination_test, data_test
 
+    def _list_h5_group(self, path, with_types=True):
+        """lists h5 group at path using low-level group iteration, which avoids
+        creating a h5py object for every child, returns list of
+        (name, child group path or None for datasets) in h5py key order,
+        listings are memoized so directory contents do not reopen groups"""
+        listing = self._scanned_tree.get(path)
+        if listing is not None and (listing[1] or not with_types):
+            return listing[0]
+        gid = h5py.h5g.open(self.data_file.id, path.encode() if path else b".")
+        entries = []
+        for name in gid:
+            key = name.decode()
+            if with_types and (h5py.h5g.get_objinfo(gid, name).type == h5py.h5g.GROUP):
+                child = path + "/" + key if path else key
+            else:
+                child = None
+            entries.append((key, child))
+        self._scanned_tree[path] = (entries, with_types)
+        return entries
+
+    def _list_node(self, node, with_types=True):
+        """returns list of (key, child node or None for data) for a node, a node
+        is either a path to h5 group or a json dict/h5 group, when with_types
+        is False only the keys are valid"""
+        if isinstance(node, str):
+            return self._list_h5_group(node, with_types)
+        return [(k, v if hasattr(v, "keys") else None) for k, v in node.items()]
+
     def get_file_directories(self):
         self.directories = []
+        self._directory_nodes = {}
+        found_directories = set()
+        self._scanned_tree = {}
+        root = "" if self.h5_mode else self.data_file
 
-        def get_directory(current_file_loc, cur_dir="", prior_dir=""):
+        def get_directory(node, cur_dir="", prior_dir="", prior_node=None):
             cur_dir_original = cur_dir
-            if hasattr(current_file_loc, "keys"):
-                termination_test, data_test = self._perform_data_tests(current_file_loc)
-                if termination_test:
-                    if cur_dir not in self.directories:
-                        self.directories.append(cur_dir)
-                        return False
-                elif data_test:
-                    if prior_dir not in self.directories:
-                        self.directories.append(prior_dir)
-                        return False
-                for key in current_file_loc.keys():
-                    if cur_dir == "":
-                        cur_dir = key
-                    else:
-                        cur_dir = cur_dir_original + "/" + key
-                    termination_found = get_directory(
-                        current_file_loc[key],
+            listing = self._list_node(node)
+            termination_test, data_test = self._perform_data_tests(
+                {key for key, _ in listing}
+            )
+            if termination_test:
+                if cur_dir not in found_directories:
+                    found_directories.add(cur_dir)
+                    self.directories.append(cur_dir)
+                    self._directory_nodes[cur_dir] = node
+                    return
+            elif data_test:
+                if prior_dir not in found_directories:
+                    found_directories.add(prior_dir)
+                    self.directories.append(prior_dir)
+                    self._directory_nodes[prior_dir] = prior_node
+                    return
+            for key, child in listing:
+                if cur_dir == "":
+                    cur_dir = key
+                else:
+                    cur_dir = cur_dir_original + "/" + key
+                if child is not None:
+                    get_directory(
+                        child,
                         cur_dir=cur_dir,
                         prior_dir=cur_dir_original,
+                        prior_node=node,
                     )
-                    if termination_found:
-                        break
 
-        get_directory(self.raw_data_file)
-        # assert False
+        get_directory(root)
         for d in self.directories:
             self.file_index[d] = {}
-        # assert False
         self.get_unique_directories()
-        # assert False
         for directory in self.directories:
             _logger.info("Found directory: {}".format(directory))
-        # assert False
 
     def get_unique_directories(self):
         """this will go through all file directories and pull out only unique ones
@@ -137,50 +466,33 @@ class PsDataImport:
 
         else:
 
+            varying_components = _get_varying_components(key_arr)
+            global_unique_set = set()
             for idx, d in enumerate(self.directories):
-                num_unique_keys = key_len[idx]
-                unique_dir = []
-                if num_unique_keys == 1:
-                    _idx = np.where(np.array(key_len) == 1)[0]
-                    for i in _idx:
-                        unique_dir = unique_dir + list(key_arr[i])
-                else:
-                    _idx = np.where(np.array(key_len) == num_unique_keys)[0]
-                    ka = []
-                    for i in _idx:
-                        ka.append(key_arr[i])
-                    ka = np.array(ka, dtype=str)
-                    for row in ka.T:
-                        uq_dirs = np.unique(row).tolist()
-                        if len(uq_dirs) > 1:
-                            unique_dir = unique_dir + list(uq_dirs)
-                array_being_processed = d.split("/")
-                if "" in array_being_processed:
-                    array_being_processed.remove("")
+                unique_dir = varying_components[key_len[idx]]
+                array_being_processed = key_arr[idx]
                 current_dir = []
                 for _id, key in enumerate(array_being_processed):
                     if str(key) in unique_dir:
                         kf = str_to_num(key)
                         prior_idx = _id - 1
-                        ldir = []
                         if prior_idx >= 0 and array_being_processed[
                             prior_idx
                         ] not in str(current_dir):
-                            ldir.append(tuple([array_being_processed[prior_idx], kf]))
+                            ld = tuple([array_being_processed[prior_idx], kf])
                         else:
-                            ldir.append(kf)
-
-                        for ld in ldir:
-                            current_dir.append(ld)
-                            if ld not in self.directory_indexes:
-                                self.directory_indexes[ld] = []
-                            self.directory_indexes[ld].append(d)
-                            if "unique_directory" not in self.file_index[d]:
-                                self.file_index[d]["unique_directory"] = [ld]
-                            else:
-                                self.file_index[d]["unique_directory"].append(ld)
-                            if kf not in self.global_unique_directories:
-                                self.global_unique_directories.append(ld)
+                            ld = kf
+                        current_dir.append(ld)
+                        if ld not in self.directory_indexes:
+                            self.directory_indexes[ld] = []
+                        self.directory_indexes[ld].append(d)
+                        if "unique_directory" not in self.file_index[d]:
+                            self.file_index[d]["unique_directory"] = [ld]
+                        else:
+                            self.file_index[d]["unique_directory"].append(ld)
+                        if kf not in global_unique_set:
+                            global_unique_set.add(ld)
+                            self.global_unique_directories.append(ld)
         _logger.info(
             "global unique directory keys: {}".format(self.global_unique_directories)
         )
@@ -195,46 +507,75 @@ class PsDataImport:
                         d, self.file_index[d]["unique_directory"]
                     )
                 )
-        for cl in clean_up:
-            self.directories.remove(cl)
-            del self.file_index[cl]
+        if clean_up:
+            clean_up = set(clean_up)
+            self.directories = [d for d in self.directories if d not in clean_up]
+            for cl in clean_up:
+                del self.file_index[cl]
 
     def get_directory_contents(self):
+        """index data keys in each directory, populates file_index data_keys lists,
+        sub_contents, unique_data_keys and directory_key_map, which maps
+        directory -> data type -> data key -> (directory, data type, data key)
+        location used for constant time key lookups"""
         self.sub_contents = []
-        self.unique_data_keys = []
+        self.directory_key_map = {}
+        found_sub_contents = set()
+        unique_data_keys = set()
         t = time.time()
+        directory_nodes = getattr(self, "_directory_nodes", None) or {}
         for d in self.file_index:
             _logger.info(f"Getting directory contents for {d}")
-            file_data = self._get_raw_data_contents(d)
-            termination_test, _ = self._perform_data_tests(file_data)
-            for k, sub_data in file_data.items():
-                if hasattr(sub_data, "keys"):
-                    _, data_test = self._perform_data_tests(sub_data)
+            node = directory_nodes.get(d)
+            if node is None:
+                node = self._get_raw_data_contents(d)
+            listing = self._list_node(node)
+            key_map = self.directory_key_map.setdefault(d, {})
+            termination_test, _ = self._perform_data_tests({k for k, _ in listing})
+            for k, sub_node in listing:
+                if sub_node is not None:
+                    sub_keys = [
+                        sk for sk, _ in self._list_node(sub_node, with_types=False)
+                    ]
+                    _, data_test = self._perform_data_tests(sub_keys)
 
                     if termination_test:
 
-                        if k not in self.sub_contents:
+                        if k not in found_sub_contents:
+                            found_sub_contents.add(k)
                             self.sub_contents.append(k)
                         if k not in self.file_index[d]:
                             self.file_index[d][k] = {}
                             self.file_index[d][k]["data_keys"] = []
-                        if len(sub_data.keys()) > 0:
-                            self.file_index[d][k]["data_keys"] += list(sub_data.keys())
-                            self.unique_data_keys += list(sub_data.keys())
+                            key_map[k] = {}
+                        if len(sub_keys) > 0:
+                            self.file_index[d][k]["data_keys"] += sub_keys
+                            unique_data_keys.update(sub_keys)
+                            for sk in sub_keys:
+                                key_map[k][sk] = (d, k, sk)
 
                     elif data_test:
                         if "data_keys" not in self.file_index[d]:
                             self.file_index[d]["data_keys"] = []
+                            key_map[None] = {}
                         self.file_index[d]["data_keys"].append(k)
-                        self.unique_data_keys.append(k)
+                        unique_data_keys.add(k)
+                        key_map[None][k] = (d, None, k)
                 else:
                     if "_data" not in self.file_index[d]:
-                        self.file_index[d]["_data"] = [k]
-                        self.sub_contents.append("_data")
+                        self.file_index[d]["_data"] = []
+                        key_map["_data"] = {}
+                        if "_data" not in found_sub_contents:
+                            found_sub_contents.add("_data")
+                            self.sub_contents.append("_data")
                         _logger.info("created auto data directory _data")
-                    if k not in self.file_index[d]["_data"]:
+                    if k not in key_map["_data"]:
                         self.file_index[d]["_data"].append(k)
-        self.unique_data_keys = np.unique(self.unique_data_keys).tolist()
+                        key_map["_data"][k] = (d, "_data", k)
+        self.unique_data_keys = sorted(unique_data_keys)
+        # scanned tree is only needed to build the index
+        self._scanned_tree = {}
+        self._directory_nodes = {}
         if len(self.sub_contents) == 0:
             _logger.info("Unique data keys found {}".format(self.unique_data_keys))
         else:
@@ -277,6 +618,10 @@ class PsDataImport:
         exact_keys=False,
         match_accuracy=None,
         PsDataManager=None,
+        num_workers=None,
+        refresh=False,
+        rows=None,
+        feasible_only=False,
     ):
         """method for automatic retrivale of data from h5 file generated by
         ps tool or loop tool
@@ -294,6 +639,7 @@ class PsDataImport:
                         'assign_units': (optional) - this will overwrite default units to specified unit
                         'conversion_factor': (optional) - this will apply manual conversion factor to raw data before assigning units
                             only works when user passes in 'assign_units' option.
+                        'storage_dtype': (optional) - dtype float data is stored as, e.g. 'float32'
                 data_key_list=[{'h5key':'fs.costing.LCOW',
                                 'return_key':'LCOW'
                                 "assign_units": "USD/m**3"},
@@ -303,6 +649,16 @@ class PsDataImport:
                 num_keys: (optional) - how many keys to return if more the 1 is found for similar named keys
                 exact_keys: (optional) - if exact keys should be imported
                 match_accuracy: (optional) - how accurately the keys need to match if exact_keys == False
+                num_workers: (optional) - number of threads used to read directories in parallel, if None or 1
+                    directories are read one after another, data is always returned in directory order
+                refresh: (optional) - if True, data already in PsDataManager is extended with rows appended
+                    to the file instead of being imported again, use after refresh() to read only new data
+                rows: (optional) - rows to read from each data set, a slice (e.g. slice(None, None, 10) for every
+                    10th sample), boolean mask or list of row indexes, h5 files only read the selected rows,
+                    can be set per key with a 'rows' entry, selected rows are returned in file order
+                feasible_only: (optional) - if True, only rows where solve_successful is True are read, the
+                    file row of every imported row is stored in PsData.row_indexes, can be set per key with a
+                    'feasible_only' entry
         """
 
         ts = time.time()
@@ -327,137 +683,437 @@ class PsDataImport:
                 len(data_key_list), len(self.unique_data_keys)
             )
         )
-        for directory in selected_directories:
-            unique_labels = self.file_index[directory]["unique_directory"]
-            for dkl in data_key_list:
-                tsk = time.time()
-                if isinstance(dkl, dict):
-                    key = dkl["filekey"]
-                    return_key = dkl["return_key"]
-                    directories = dkl.get("search_directories", None)
-                    save_directory = dkl.get("directory", None)
-                    # assert False
-                    import_options = dkl
+        existing = None
+        if refresh and PsDataManager is not None:
+            existing = PsDataManager.get_imported_data
+        with self._use_file():
+            directory_data = self._read_directories(
+                selected_directories,
+                data_key_list,
+                directories,
+                exact_keys,
+                existing,
+                rows,
+                feasible_only,
+                num_workers,
+            )
+        # merge in directory order so results do not depend on num_workers
+        for entries in directory_data:
+            for return_dir, return_key, data in entries:
+                if PsDataManager is not None:
+                    PsDataManager.add_data(return_dir, return_key, data)
                 else:
-                    key = dkl
-                    return_key = None
-                    import_options = {}
-                if directories is None or self.test_if_in_directory(
-                    directories, unique_labels
-                ):
-                    data_keys, data_type = self._get_nearest_key(
-                        directory, key, exact_keys
+                    data_dict[return_dir, return_key] = data
+        _logger.info("Done importing data in {} seconds!".format(time.time() - ts))
+        if PsDataManager is not None:
+            return PsDataManager
+        else:
+            return data_dict
+
+    def _read_directories(
+        self,
+        selected_directories,
+        data_key_list,
+        search_directories,
+        exact_keys,
+        existing,
+        rows,
+        feasible_only,
+        num_workers,
+    ):
+        """reads data of selected directories, in a thread pool if num_workers
+        is larger than 1, returns list of entries per directory in directory
+        order"""
+        if num_workers is None or num_workers <= 1 or len(selected_directories) <= 1:
+            directory_data = [
+                self._get_directory_data(
+                    directory,
+                    data_key_list,
+                    search_directories,
+                    exact_keys,
+                    existing,
+                    rows,
+                    feasible_only,
+                )
+                for directory in selected_directories
+            ]
+        else:
+            if not exact_keys:
+                # build shared search index once, before workers need it
+                self.key_search_index
+            _logger.info(
+                "Importing {} directories using {} threads".format(
+                    len(selected_directories), num_workers
+                )
+            )
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                futures = [
+                    pool.submit(
+                        self._get_directory_data,
+                        directory,
+                        data_key_list,
+                        search_directories,
+                        exact_keys,
+                        existing,
+                        rows,
+                        feasible_only,
                     )
+                    for directory in selected_directories
+                ]
+                directory_data = [future.result() for future in futures]
+        return directory_data
+
+    def _get_directory_data(
+        self,
+        directory,
+        data_key_list,
+        search_directories,
+        exact_keys,
+        existing=None,
+        rows=None,
+        feasible_only=False,
+    ):
+        """reads all requested keys from a single directory, does not modify
+        importer state so it can be called from multiple threads, returns
+        list of (return directory, return key, PsData)
+
+        existing: (optional) callable returning already imported PsData for
+            (return directory, return key) or None, existing data is extended
+            with rows appended to the file instead of being re-imported
+        rows: (optional) row selection used for keys without a 'rows' option
+        feasible_only: (optional) used for keys without a 'feasible_only' option"""
+        unique_labels = self.file_index[directory]["unique_directory"]
+        save_directory = None
+        entries = []
+
+        def get_return_keys(return_key, index_str):
+            if len(data_keys) > 1:
+                _return_key = tuple([return_key, index_str])
+            else:
+                _return_key = return_key
+            return_dir = copy.copy(unique_labels)
+            if "_auto_temp" in return_dir:
+                return_dir.remove("_auto_temp")
+            if self.default_return_directory is not None:
+                idx = [self.default_return_directory]
+
+                if isinstance(return_dir, list):
+                    return_dir = idx + return_dir
                 else:
-                    data_keys = None
-                if data_keys != None:
-                    for i, dk in enumerate(data_keys):
-                        t = time.time()
-                        data = self._get_data_set_auto(
-                            directory, data_type, dk, data_object_options=import_options
+                    return_dir = idx
+            if len(_return_key) == 1:
+                return_dir = idx[0]
+            else:
+                if isinstance(return_dir, str):
+                    return_dir = None
+
+            if save_directory is not None:
+                if isinstance(return_dir, list):
+                    return_dir.append(return_dir["directory"])
+                elif return_dir is None:
+                    return_dir = [save_directory]
+
+                return_dir = tuple(return_dir)
+            return return_dir, _return_key
+
+        for dkl in data_key_list:
+            if isinstance(dkl, dict):
+                key = dkl["filekey"]
+                return_key = dkl["return_key"]
+                search_directories = dkl.get("search_directories", None)
+                save_directory = dkl.get("directory", None)
+                import_options = dkl
+            else:
+                key = dkl
+                return_key = None
+                import_options = {}
+            row_selection = import_options.get("rows", rows)
+            read_feasible_only = import_options.get("feasible_only", feasible_only)
+            if search_directories is None or self.test_if_in_directory(
+                search_directories, unique_labels
+            ):
+                data_keys, data_type = self._get_nearest_key(directory, key, exact_keys)
+            else:
+                data_keys = None
+            if data_keys != None:
+                for i, dk in enumerate(data_keys):
+                    _, index_str = self.get_key_indexes(dk)
+                    if index_str == None:
+                        index_str = i
+                    # data with a row selection is re-imported, as appended rows
+                    # can change which rows are selected
+                    if (
+                        existing is not None
+                        and row_selection is None
+                        and not read_feasible_only
+                    ):
+                        return_dir, _return_key = get_return_keys(
+                            dk if return_key == None else return_key, index_str
                         )
-                        if data is not None:
+                        current = existing(return_dir, _return_key)
+                        if current is not None:
+                            self._extend_data_set(directory, data_type, dk, current)
                             if return_key == None:
                                 return_key = dk
+                            continue
+                    try:
+                        data = self._get_data_set_auto(
+                            directory,
+                            data_type,
+                            dk,
+                            data_object_options=import_options,
+                            rows=row_selection,
+                            feasible_only=read_feasible_only,
+                        )
+                    except (KeyError, ValueError) as e:
+                        if not self.swmr:
+                            raise
+                        # key is still being written, pick it up on next refresh
+                        _logger.info(
+                            "Skipping partially written {} in {}: {}".format(
+                                dk, directory, e
+                            )
+                        )
+                        data = None
+                    if data is not None:
+                        if return_key == None:
+                            return_key = dk
+                        return_dir, _return_key = get_return_keys(return_key, index_str)
+                        data.set_label(_return_key)
+                        entries.append((return_dir, _return_key, data))
+        return entries
 
-                            if len(data_keys) > 1:
-                                index_str = data.key_index_str
-                                if index_str == None:
-                                    index_str = i
-                                _return_key = tuple([return_key, index_str])
-                            else:
-                                _return_key = return_key
-                            return_dir = copy.copy(unique_labels)
-                            if "_auto_temp" in return_dir:
-                                return_dir.remove("_auto_temp")
-                            if self.default_return_directory is not None:
-                                idx = [self.default_return_directory]
-
-                                if isinstance(return_dir, list):
-                                    return_dir = idx + return_dir
-                                else:
-                                    return_dir = idx
-                            if len(_return_key) == 1:
-                                return_dir = idx[0]
-                            else:
-                                if isinstance(return_dir, str):
-                                    return_dir = None
-
-                            if save_directory is not None:
-                                if isinstance(return_dir, list):
-                                    return_dir.append(return_dir["directory"])
-                                elif return_dir is None:
-                                    return_dir = [save_directory]
-
-                                return_dir = tuple(return_dir)
-                            data.set_label(_return_key)
-
-                            if PsDataManager is not None:
-                                PsDataManager.add_data(return_dir, _return_key, data)
-                            else:
-                                data_dict[return_dir, _return_key] = data
+    def _extend_data_set(self, directory, data_type, data_key, ps_data):
+        """updates imported PsData with rows appended to its data set since it
+        was imported, only the new rows are read from h5 files"""
+        group = self._get_raw_data_contents(directory)
+        source, _ = self._get_data_source(group, data_type, data_key)
+        if self.h5_mode and self.swmr:
+            source.refresh()
+        feasible_indexes = self._get_feasible_mask(directory, group)
+        if ps_data._lazy_source is not None and self.h5_mode:
+            ps_data._lazy_source = LazyArray(
+                self._get_lazy_source(source), budget=self.memory_budget
+            )
+            ps_data.feasible_indexes = feasible_indexes
+            # unmodified data is simply re-read from the new source on access
+            if not ps_data.is_loaded or ps_data._release_lazy_data():
+                return
+        if isinstance(source, JsonValue):
+            source = source[()]
+        num_rows = len(ps_data._original_data)
+        if len(source) > num_rows:
+            ps_data.extend_data(source[num_rows:], feasible_indexes)
+        else:
+            ps_data.feasible_indexes = feasible_indexes
 
-        _logger.info("Done importing data in {} seconds!".format(time.time() - ts))
-        if PsDataManager is not None:
-            return PsDataManager
+    @property
+    def data_file(self):
+        """open h5 file, json data or streamed json root, pooled h5 files are
+        re-opened if the pool closed them"""
+        if self.handle_pool is not None and self.h5_mode:
+            return self.handle_pool.get(self.h5_fileLocation)
+        if self._data_file is None:
+            # unpickled import, file is re-opened on first access
+            self._open_file()
+        return self._data_file
+
+    @data_file.setter
+    def data_file(self, data_file):
+        self._data_file = data_file
+
+    def _get_h5_file_options(self):
+        file_options = {}
+        if self.swmr:
+            file_options.update(libver="latest", swmr=True)
+        if self.chunk_cache is not None:
+            file_options.update(self.chunk_cache)
+        return file_options
+
+    def _use_file(self):
+        """context that keeps a pooled h5 file open while it is active"""
+        if self.handle_pool is not None and self.h5_mode:
+            return self.handle_pool.use(self.h5_fileLocation)
+        return nullcontext()
+
+    def _get_lazy_source(self, data):
+        """source for LazyArray, the dataset is referenced by path, so lazy
+        data does not keep open dataset objects, pooled files can be closed
+        before data is read"""
+        if self.handle_pool is not None:
+            return PooledDataset(self.handle_pool, self.h5_fileLocation, data.name)
+        return _ImportedDataset(self, data.name)
+
+    def _open_file(self):
+        if self.h5_mode:
+            self.get_h5_file(self.h5_fileLocation)
         else:
-            return data_dict
+            self.get_json_file(self.json_fileLocation)
+
+    def __getstate__(self):
+        """open files are not pickled, the file index is, so an unpickled
+        import re-opens its file on first access without re-scanning it"""
+        state = self.__dict__.copy()
+        for attr in ("raw_data_file", "json_stream_file"):
+            state.pop(attr, None)
+        state["_data_file"] = None
+        state["_scanned_tree"] = {}
+        state["_feasible_masks"] = {}
+        state["_key_search_index"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.raw_data_file = None
 
     def get_h5_file(self, location):
-        self.data_file = h5py.File(location, "r")
-        self.raw_data_file = self.data_file
         self.h5_mode = True
+        if self.handle_pool is not None:
+            self.data_file = None
+            self.raw_data_file = self.handle_pool.get(
+                location, **self._get_h5_file_options()
+            )
+        else:
+            self.data_file = h5py.File(location, "r", **self._get_h5_file_options())
+            self.raw_data_file = self.data_file
 
     def get_json_file(self, location):
-        with open(location) as f:
-            self.data_file = json.load(f)
-            self.raw_data_file = self.data_file
+        if self.stream_json:
+            self.json_stream_file = JsonStreamFile(location)
+            self.data_file = self.json_stream_file.root
+        else:
+            with open(location) as f:
+                self.data_file = json.load(f)
+        self.raw_data_file = self.data_file
+        self.h5_mode = False
         self.json_mode = True
 
+    def _get_data_source(self, group, data_type, data_key):
+        """returns data set (h5 dataset, json list or JsonValue) and units of a
+        key in directory group, data is not read"""
+        if data_type is None:
+            if "value" in group[data_key]:
+                data = group[data_key]["value"]
+            elif "values" in group[data_key]:
+                data = group[data_key]["values"]
+            else:
+                data = group[data_key]
+            if "units" in group[data_key]:
+                units = group[data_key]["units"]
+            else:
+                _logger.info(f"No units for {data_key}")
+                units = "dimensionless"
+        else:
+            if "value" in group[data_type][data_key]:
+                data = group[data_type][data_key]["value"]
+            elif "values" in group[data_type][data_key]:
+                data = group[data_type][data_key]["values"]
+            else:
+                data = group[data_type][data_key]
+            if "units" in group[data_type][data_key]:
+                units = group[data_type][data_key]["units"]
+            else:
+                units = "dimensionless"
+
+        return data, units
+
+    def _select_rows(
+        self, rows, feasible_only, feasible_mask, num_rows, data_key, directory
+    ):
+        """returns selection to read from data set and indexes of the selected
+        rows in the file (None if all rows are read), with feasible_only
+        infeasible rows are dropped from the selection, an empty selection
+        selects no rows"""
+        try:
+            selection = _get_row_selection(rows, num_rows)
+        except ValueError as e:
+            raise ValueError(
+                "Invalid rows for {} in directory {}: {}".format(data_key, directory, e)
+            ) from e
+        if not (feasible_only and isinstance(feasible_mask, np.ndarray)):
+            if rows is None:
+                return selection, None
+            return selection, np.arange(num_rows)[selection]
+        row_indexes = np.arange(num_rows)[selection]
+        row_indexes = row_indexes[_get_feasible_rows(feasible_mask, row_indexes)]
+        return _get_row_selection(row_indexes, num_rows), row_indexes
+
     def _get_data_set_auto(
-        self, directory, data_type, data_key, data_object_options={}
+        self,
+        directory,
+        data_type,
+        data_key,
+        data_object_options={},
+        rows=None,
+        feasible_only=False,
     ):
-        self._get_data(directory)
+        # group is local so concurrent reads from other directories are safe
+        group = self._get_raw_data_contents(directory)
         units = "dimensionless"
         data = None
-
-        def _get_data_from_file(data_type, data_key):
-            if data_type is None:
-                if "value" in self.raw_data_file[data_key]:
-                    data = self.raw_data_file[data_key]["value"]
-                elif "values" in self.raw_data_file[data_key]:
-                    data = self.raw_data_file[data_key]["values"]
-                else:
-                    data = self.raw_data_file[data_key]
-                if "units" in self.raw_data_file[data_key]:
-                    units = self.raw_data_file[data_key]["units"]
-                else:
-                    _logger.info(f"No units for {data_key}")
-                    units = "dimensionless"
-            else:
-                if "value" in self.raw_data_file[data_type][data_key]:
-                    data = self.raw_data_file[data_type][data_key]["value"]
-                elif "values" in self.raw_data_file[data_type][data_key]:
-                    data = self.raw_data_file[data_type][data_key]["values"]
-                else:
-                    data = self.raw_data_file[data_type][data_key]
-                if "units" in self.raw_data_file[data_type][data_key]:
-                    units = self.raw_data_file[data_type][data_key]["units"]
-                else:
-                    units = "dimensionless"
-
-            return data, units
+        storage_dtype = data_object_options.get("storage_dtype", self.storage_dtype)
+        feasible_mask = self._get_feasible_mask(directory, group)
+        row_indexes = None
 
         if self.h5_mode:
-            data, units = _get_data_from_file(data_type, data_key)
-            data = data[()]
+            data, units = self._get_data_source(group, data_type, data_key)
+            if self.swmr:
+                data.refresh()
+            selection = ()
+            if data.ndim > 0:
+                selection, row_indexes = self._select_rows(
+                    rows,
+                    feasible_only,
+                    feasible_mask,
+                    data.shape[0],
+                    data_key,
+                    directory,
+                )
+                if row_indexes is not None and len(row_indexes) == 0:
+                    _logger.info(
+                        "No selected rows for {} in {}".format(data_key, directory)
+                    )
+                    return None
+            if self.lazy_load and data.ndim > 0:
+                data = LazyArray(
+                    self._get_lazy_source(data),
+                    budget=self.memory_budget,
+                    selection=selection,
+                )
+            else:
+                # read in the file dtype, PsData casts to storage_dtype and
+                # keeps a wider dtype for data that would overflow it
+                data = read_rows(data, selection)
             if units != "dimensionless":
                 units = units[()].decode()
         if self.json_mode:
-            data, units = _get_data_from_file(data_type, data_key)
+            data, units = self._get_data_source(group, data_type, data_key)
+            if isinstance(data, JsonValue):
+                data = data[()]
+            if (rows is not None or feasible_only) and isinstance(
+                data, (np.ndarray, list)
+            ):
+                data = _list_to_array(data)
+                selection, row_indexes = self._select_rows(
+                    rows,
+                    feasible_only,
+                    feasible_mask,
+                    len(data),
+                    data_key,
+                    directory,
+                )
+                if row_indexes is not None and len(row_indexes) == 0:
+                    _logger.info(
+                        "No selected rows for {} in {}".format(data_key, directory)
+                    )
+                    return None
+                data = data[selection]
+                if data.dtype.kind == "U":
+                    # str data is flagged as non numeric by PsData from lists
+                    data = data.tolist()
         if units == "None":
             units = "dimensionless"
-        if isinstance(data, (np.ndarray, list)):
+        if isinstance(data, (np.ndarray, list, LazyArray)):
             if len(data) == 0:
                 raise ValueError(
                     "No data found for directory {} data type {} data key {}".format(
@@ -466,18 +1122,24 @@ class PsDataImport:
                 )
             result = data
             idx, idx_str = self.get_key_indexes(data_key)
+            feasible_indexes = feasible_mask
+            if row_indexes is not None:
+                feasible_indexes = _get_feasible_rows(feasible_mask, row_indexes)
             try:
                 data_object = PsData(
                     data_key,
                     data_type,
                     result,
                     units,
-                    self.get_feasible_idxs(data=result),
+                    feasible_indexes,
                     custom_units=self.custom_units,
-                    **data_object_options,
+                    # h5 reads are new arrays, json data may be cached
+                    copy=not self.h5_mode,
+                    **dict(data_object_options, storage_dtype=storage_dtype),
                 )
                 data_object.key_index = idx
                 data_object.key_index_str = idx_str
+                data_object.row_indexes = row_indexes
                 return data_object
             except RuntimeError:
                 return None
@@ -494,11 +1156,11 @@ class PsDataImport:
                 return [data_key]
             elif exact_key:
                 return None
-            near_keys = difflib.get_close_matches(
+            near_keys = self.key_search_index.get_close_matches(
                 data_key,
-                available_keys,
-                cutoff=self.search_cut_off,
                 n=self.num_keys,
+                cutoff=self.search_cut_off,
+                restrict_to=available_keys,
             )
             _logger.debug(
                 "_get_nearest_key took (nearest): {}".format(time.time() - t),
@@ -508,19 +1170,27 @@ class PsDataImport:
             else:
                 return None
 
+        key_map = self.directory_key_map[directory]
+        near_keys = None
+        data_type = None
         if self.sub_contents != []:
             for data_type in self.sub_contents:
-                if data_type in self.file_index[directory]:
-                    available_keys = self.file_index[directory][data_type]["data_keys"]
-                    near_keys = get_key(data_key, available_keys)
+                if data_type in key_map:
+                    near_keys = get_key(data_key, key_map[data_type])
                     if near_keys is not None:
                         break
         else:
-            available_keys = self.file_index[directory]["data_keys"]
-            near_keys = get_key(data_key, available_keys)
-            data_type = None
+            near_keys = get_key(data_key, key_map.get(None, {}))
         return near_keys, data_type
 
+    @property
+    def key_search_index(self):
+        """:class:`FuzzyKeyIndex` over all unique data keys, built on first use
+        and used for near key searches"""
+        if self._key_search_index is None:
+            self._key_search_index = FuzzyKeyIndex(self.unique_data_keys)
+        return self._key_search_index
+
     def display_loaded_contents(self):
         _logger.info("---Displaying loaded data contents---")
         for d in self.file_index:
@@ -552,15 +1222,27 @@ class PsDataImport:
         self._get_data()
         return np.array(self.raw_data_file[()])
 
+    def _get_feasible_mask(self, directory, group):
+        """returns feasibility mask for directory, read once and shared by all
+        data in directory"""
+        if directory in self._feasible_masks:
+            return self._feasible_masks[directory]
+        if "solve_successful" in group:
+            solve_successful = group["solve_successful"]["solve_successful"]
+            if self.h5_mode and self.swmr:
+                solve_successful.refresh()
+            if not isinstance(solve_successful, list):
+                solve_successful = solve_successful[()]
+            filtered = np.array(solve_successful, dtype=bool)
+            # mask is shared by all data in directory, so prevent in-place edits
+            filtered.flags.writeable = False
+        else:
+            filtered = False
+        return self._feasible_masks.setdefault(directory, filtered)
+
     def get_feasible_idxs(self, data=None, val=None):
         if val is None:
-            if "solve_successful" in self.raw_data_file:
-                filtered = np.array(
-                    self.raw_data_file["solve_successful"]["solve_successful"][()],
-                    dtype=bool,
-                )
-            else:
-                filtered = False
+            filtered = self._get_feasible_mask(self.cur_dir, self.raw_data_file)
         elif data is not None:
             feasible = np.zeros(len(data), dtype=bool)
             filtered = np.where(np.array(data) != val)
@@ -0,0 +1,181 @@
+"""Shared pool of open HDF5 file handles.
+
+Every open ``h5py.File`` holds an OS file handle and its own metadata and
+chunk caches. When hundreds of result files are registered on one
+:class:`PsDataManager` this runs into open file limits. :class:`H5HandlePool`
+caps the number of files open at the same time, closes the least recently
+used file when the cap is reached, and re-opens files transparently when
+they are accessed again.
+
+Example::
+
+    pool = H5HandlePool(max_open_files=32)
+    data_file = pool.get("sweep.h5", rdcc_nbytes=16 * 1024**2)
+    with pool.use("sweep.h5"):
+        data = pool.get("sweep.h5")["outputs/LCOW/value"][()]
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import h5py
+
+from psPlotKit.util import logger
+
+__author__ = "Alexander V. Dudchenko "
+
+_logger = logger.define_logger(__name__, "H5HandlePool", level="INFO")
+
+_default_pool = None
+
+
+class H5HandlePool:
+    """LRU pool of read only ``h5py.File`` handles shared between imports.
+
+    Args:
+        max_open_files: maximum number of files kept open, files that are in
+            use (see :meth:`use`) are never closed, so the limit can be
+            exceeded while more files are in use at the same time.
+    """
+
+    def __init__(self, max_open_files=64):
+        self.max_open_files = max_open_files
+        self._handles = OrderedDict()
+        self._file_options = {}
+        self._in_use = {}
+        self._lock = threading.RLock()
+
+    def get(self, location, **file_options):
+        """Return an open handle for *location*, opening it if needed.
+
+        Args:
+            location: path to the h5 file.
+            **file_options: options passed to ``h5py.File`` (e.g. ``swmr``,
+                ``libver`` or chunk cache sizes ``rdcc_nbytes``,
+                ``rdcc_nslots``, ``rdcc_w0``), options are remembered per file
+                and reused when the file is re-opened.
+        """
+        with self._lock:
+            if file_options:
+                self.set_file_options(location, **file_options)
+            handle = self._handles.get(location)
+            if handle is not None and handle.id.valid:
+                self._handles.move_to_end(location)
+                return handle
+            handle = h5py.File(location, "r", **self._file_options.get(location, {}))
+            self._handles[location] = handle
+            self._close_unused()
+            return handle
+
+    def set_file_options(self, location, **file_options):
+        """Set ``h5py.File`` options used when *location* is (re-)opened."""
+        self._file_options[location] = file_options
+
+    @contextmanager
+    def use(self, location):
+        """Keep *location* open while the context is active."""
+        with self._lock:
+            self._in_use[location] = self._in_use.get(location, 0) + 1
+        try:
+            yield self.get(location)
+        finally:
+            with self._lock:
+                self._in_use[location] -= 1
+                if self._in_use[location] == 0:
+                    del self._in_use[location]
+                self._close_unused()
+
+    def _close_unused(self):
+        """closes least recently used files that are not in use until at most
+        max_open_files are open"""
+        if len(self._handles) <= self.max_open_files:
+            return
+        for location in list(self._handles):
+            if len(self._handles) <= self.max_open_files:
+                break
+            if location in self._in_use:
+                continue
+            _logger.debug("Closing least recently used file {}".format(location))
+            self._handles.pop(location).close()
+
+    def close(self, location):
+        """Close *location*, it is re-opened on next access."""
+        with self._lock:
+            handle = self._handles.pop(location, None)
+            if handle is not None:
+                handle.close()
+
+    def close_all(self):
+        with self._lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+
+    @property
+    def open_files(self):
+        """locations of currently open files, least recently used first"""
+        return list(self._handles)
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __getstate__(self):
+        # open handles and the lock are not pickled, files are re-opened on
+        # access in the receiving process
+        return {
+            "max_open_files": self.max_open_files,
+            "_file_options": self._file_options,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["max_open_files"])
+        self._file_options = state["_file_options"]
+
+
+def get_default_pool():
+    """Return the process wide pool used for unpickled lazy data whose file
+    was not opened through a pool."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = H5HandlePool()
+    return _default_pool
+
+
+class PooledDataset:
+    """Reference to a dataset in a pooled file, used as source of a
+    :class:`LazyArray` so it stays valid when the pool closes the file.
+
+    Args:
+        pool: :class:`H5HandlePool` holding the file.
+        location: path to the h5 file.
+        name: path of the dataset in the file.
+    """
+
+    def __init__(self, pool, location, name):
+        self.pool = pool
+        self.location = location
+        self.name = name
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """reference to an open h5py dataset using the default pool"""
+        pool = get_default_pool()
+        pool.set_file_options(dataset.file.filename, **_get_file_options(dataset.file))
+        return cls(pool, dataset.file.filename, dataset.name)
+
+    @property
+    def shape(self):
+        with self.pool.use(self.location) as data_file:
+            return data_file[self.name].shape
+
+    def __getitem__(self, selection):
+        with self.pool.use(self.location) as data_file:
+            return data_file[self.name][selection]
+
+
+def _get_file_options(data_file):
+    """options to re-open an open file the same way"""
+    if data_file.swmr_mode:
+        return {"libver": "latest", "swmr": True}
+    return {}
@@ -0,0 +1,163 @@
+"""Streaming reader for large JSON result files.
+
+``json.load`` materializes the whole document as Python lists and dicts,
+which for large sweep outputs takes several times the file size in memory.
+:class:`JsonStreamFile` instead memory maps the file and walks it once,
+keeping only the object structure (keys and small scalar values such as
+units). Every array is replaced by a :class:`JsonValue` that records where
+the array is stored in the file and parses it into a NumPy array only when
+it is read, so only the requested keys are ever materialized. Arrays that
+are not purely numeric (e.g. holding null or strings) are returned as lists,
+so they are converted by PsData the same way as json.load data.
+
+Example::
+
+    json_file = JsonStreamFile("sweep_results.json")
+    data = json_file.root["outputs"]["fs.costing.LCOW"]["value"][()]
+"""
+
+import json
+import mmap
+import re
+
+import numpy as np
+
+__author__ = "Alexander V. Dudchenko "
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^,\]}\s]+")
+# arrays without nested arrays, objects or strings can be skipped in one match
+_FLAT_ARRAY = re.compile(rb"\[[^\[\]{}\"]*\]")
+_ARRAY_TOKEN = re.compile(rb'[\[\]"]')
+# arrays holding only these characters are parsed directly into numpy
+_NUMERIC_ARRAY = re.compile(rb"\[[0-9eE+\-.,\s]*\]")
+
+
+class JsonValue:
+    """Reference to an array stored in a JSON file, read on access.
+
+    Supports ``value[()]`` like a h5py dataset, which returns the parsed
+    array.
+
+    Args:
+        buffer: memory mapped JSON file.
+        start: offset of the opening bracket of the array.
+        end: offset just past the closing bracket of the array.
+    """
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    @property
+    def nbytes(self):
+        """size of the array text in the file"""
+        return self.end - self.start
+
+    def read(self):
+        """parses the array, numeric arrays are converted directly into a
+        float numpy array without building a Python list first, other arrays
+        are returned as lists like json.load returns them"""
+        text = self.buffer[self.start : self.end]
+        if _NUMERIC_ARRAY.fullmatch(text):
+            body = text[1:-1].strip()
+            if not body:
+                return np.array([])
+            return np.fromstring(body.decode(), dtype=float, sep=",")
+        return json.loads(text)
+
+    def __getitem__(self, key):
+        if key == ():
+            return self.read()
+        return np.asarray(self.read())[key]
+
+
+class JsonStreamFile:
+    """Structure of a JSON file with arrays left in the file.
+
+    Args:
+        location: path to the JSON file.
+
+    Attributes:
+        root: nested dicts mirroring the JSON objects in the file, arrays
+            are :class:`JsonValue` references and other values are parsed.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        with open(location, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        value, end = self._parse_value(self._skip_whitespace(0))
+        self.root = value
+
+    def close(self):
+        self.root = None
+        self.buffer.close()
+
+    def _skip_whitespace(self, pos):
+        return _WHITESPACE.match(self.buffer, pos).end()
+
+    def _parse_value(self, pos):
+        char = self.buffer[pos : pos + 1]
+        if char == b"{":
+            return self._parse_object(pos)
+        if char == b"[":
+            end = self._skip_array(pos)
+            return JsonValue(self.buffer, pos, end), end
+        if char == b'"':
+            end = _STRING.match(self.buffer, pos).end()
+            return json.loads(self.buffer[pos:end]), end
+        match = _SCALAR.match(self.buffer, pos)
+        if match is None:
+            raise ValueError(
+                "Invalid JSON value at offset {} in {}".format(pos, self.location)
+            )
+        return json.loads(match.group()), match.end()
+
+    def _parse_object(self, pos):
+        contents = {}
+        pos = self._skip_whitespace(pos + 1)
+        if self.buffer[pos : pos + 1] == b"}":
+            return contents, pos + 1
+        while True:
+            key_end = _STRING.match(self.buffer, pos).end()
+            key = json.loads(self.buffer[pos:key_end])
+            pos = self._skip_whitespace(key_end)
+            if self.buffer[pos : pos + 1] != b":":
+                raise ValueError(
+                    "Expected ':' at offset {} in {}".format(pos, self.location)
+                )
+            value, pos = self._parse_value(self._skip_whitespace(pos + 1))
+            contents[key] = value
+            pos = self._skip_whitespace(pos)
+            char = self.buffer[pos : pos + 1]
+            if char == b"}":
+                return contents, pos + 1
+            if char != b",":
+                raise ValueError(
+                    "Expected ',' or '}}' at offset {} in {}".format(pos, self.location)
+                )
+            pos = self._skip_whitespace(pos + 1)
+
+    def _skip_array(self, pos):
+        """returns offset just past the array starting at pos"""
+        match = _FLAT_ARRAY.match(self.buffer, pos)
+        if match is not None:
+            return match.end()
+        depth = 0
+        while True:
+            token = _ARRAY_TOKEN.search(self.buffer, pos)
+            if token is None:
+                raise ValueError(
+                    "Unterminated array at offset {} in {}".format(pos, self.location)
+                )
+            char = token.group()
+            if char == b'"':
+                pos = _STRING.match(self.buffer, token.start()).end()
+                continue
+            pos = token.end()
+            depth += 1 if char == b"[" else -1
+            if depth == 0:
+                return pos
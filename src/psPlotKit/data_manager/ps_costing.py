@@ -51,7 +51,6 @@ Example
     cm.build()
 """
 
-import difflib
 import time
 
 import numpy as np
@@ -59,6 +58,7 @@ import numpy as np
 import quantities as qs
 from psPlotKit.data_manager.ps_data import PsData
 from psPlotKit.data_manager.ps_expression import ExpressionNode
+from psPlotKit.data_manager.ps_key_index import FuzzyKeyIndex
 from psPlotKit.util.logger import define_logger
 
 # Sentinel key used by _GroupExpressionKeys to reference a zero-fill
@@ -685,7 +685,7 @@ class PsCostingManager:
         if not self._unfound_unit_keys:
             return
 
-        available = sorted(self._get_all_available_keys())
+        available = FuzzyKeyIndex(sorted(self._get_all_available_keys()))
         _logger.warning(
             "{} requested costing key pattern(s) were NOT discovered.".format(
                 len(self._unfound_unit_keys)
@@ -699,9 +699,7 @@ class PsCostingManager:
                     group_name, unit_name, cost_type, suffix
                 )
             )
-            nearest = difflib.get_close_matches(
-                search_term, available, n=10, cutoff=0.3
-            )
+            nearest = available.get_close_matches(search_term, n=10, cutoff=0.3)
             if nearest:
                 _logger.warning("    Nearest available keys:")
                 for n in nearest:
@@ -1,7 +1,7 @@
 from psPlotKit.util import logger
 import numpy as np
 import quantities as qs
-from psPlotKit.data_manager.ps_data import PsData
+from psPlotKit.data_manager.ps_data import PsData, get_default_units
 
 __author__ = "Alexander V. Dudchenko "
 
@@ -31,7 +31,7 @@ class PsCosting:
         self.default_flow = default_flow
         self.define_device_energy_pars(work_keys)
         self.default_costing()
-        self.USD = qs.UnitQuantity("USD")
+        self.USD = get_default_units().USD
         self.fixed_operating_cost_ref = ["fixed_operating_cost"]
         self.include_indirect_in_device_costs = include_indirect_in_device_costs
 
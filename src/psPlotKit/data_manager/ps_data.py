@@ -1,18 +1,143 @@
+import h5py
 import numpy as np
 import quantities as qs
 from psPlotKit.util import logger
+from psPlotKit.data_manager.h5_handle_pool import PooledDataset
+from psPlotKit.data_manager.shared_arrays import (
+    SharedArrayReference,
+    get_shared_reference,
+    is_same_view,
+)
 import re
 import copy
+import functools
 
 __author__ = "Alexander V. Dudchenko "
 
 _logger = logger.define_logger(__name__, "PsData", level="INFO")
 import time
 import datetime
+import threading
+import weakref
+from collections import OrderedDict
+
+# PsData slots that hold array data; on a lazily imported PsData these are
+# only set once the data is read from file
+_ARRAY_SLOTS = ("_original_data", "_raw_data", "_raw_data_array", "_data_array")
+_LAZY_ATTRIBUTES = frozenset(_ARRAY_SLOTS)
+# public names of array slots in pickled and saved states
+_STATE_NAMES = {"_data_array": "data", "_raw_data_array": "raw_data"}
+# unit arrays, the slots caching them and the array slots they are views of
+_UNIT_ARRAYS = (
+    ("data_with_units", "_data_with_units", "_data_array"),
+    ("raw_data_with_units", "_raw_data_with_units", "_raw_data_array"),
+)
+# attributes derived from other attributes, ignored in restored states
+_DERIVED_ATTRIBUTES = ("custom_units", "mpl_units", "_pickled_views")
+_MISSING = object()
+
+
+def _get_slot(ps_data, name, default=None):
+    """returns attribute without triggering lazy loading"""
+    try:
+        return object.__getattribute__(ps_data, name)
+    except AttributeError:
+        return default
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_mpl_units(sunits):
+    """returns matplotlib label of a unit string"""
+    units = sunits
+    if "**" in sunits:
+        uf = units.split("/")
+        for i, u in enumerate(uf):
+            if "**" in u:
+                u_t = u.replace("**", "^")
+                uf[i] = "${}$".format(u_t)
+            if u == "USD":
+                uf[i] = "$\\$$"
+            elif u == "kUSD":
+                uf[i] = "k$\\$$"
+            elif u == "MUSD":
+                uf[i] = "M$\\$$"
+
+        units = "/".join(uf)
+    if "dimensionless" in sunits:
+        units = "-"
+    return units
+
+
+def _convert(array, factor, offset=0.0):
+    """returns array * factor + offset as float data, float arrays are
+    returned unchanged if the conversion does nothing, float16 data is
+    converted in float32 and stored as float16"""
+    if factor == 1 and offset == 0 and array.dtype.kind == "f":
+        return array
+    result = _upcast(array) * factor
+    if offset != 0:
+        result += offset
+    if result.dtype != array.dtype and array.dtype.kind == "f":
+        # converted data that exceeds the range of the dtype is kept wider
+        cast = _cast_float(result, array.dtype)
+        if cast is not None:
+            result = cast
+    return result
+
+
+def _cast_float(array, dtype):
+    """returns float array cast to dtype, None if values exceed the range of
+    dtype and would become inf"""
+    with np.errstate(over="ignore"):
+        result = array.astype(dtype)
+    if result.dtype.itemsize < array.dtype.itemsize and not np.array_equal(
+        np.isfinite(result), np.isfinite(array)
+    ):
+        return None
+    return result
+
+
+def _upcast(array):
+    """returns float16 arrays as float32 for computations, float16 arithmetic
+    loses too much precision"""
+    if getattr(array, "dtype", None) == np.float16:
+        return array.astype(np.float32)
+    return array
+
+
+def get_storage_dtype(*data):
+    """Return the storage dtype for data computed from PsData, the widest
+    storage dtype of the PsData, or None (float64) if any PsData has none."""
+    dtypes = []
+    for ps_data in data:
+        if isinstance(ps_data, PsData):
+            if ps_data.storage_dtype is None:
+                return None
+            dtypes.append(ps_data.storage_dtype)
+    if not dtypes:
+        return None
+    return np.result_type(*dtypes).name
+
+
+def _read_only_view(array):
+    """returns read-only view of array, the array itself stays writeable"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
 
 
 class CustomUnits:
+    """Units that are not defined by quantities (USD, kUSD, MUSD, PPM).
+
+    PsData, PsDataImport and expressions share the process-wide instance
+    returned by :func:`get_default_units`, so units are only created once.
+    """
+
     def __init__(self):
+        self._lock = threading.RLock()
+        # parsed unit strings and (source, target) conversions
+        self._dimensionality_cache = {}
+        self._conversion_cache = {}
         self.USD = qs.UnitQuantity("USD")
         self.kUSD = qs.UnitQuantity("kUSD", 1000 * self.USD, symbol="kUSD")
         self.MUSD = qs.UnitQuantity("MUSD", 1e6 * self.USD, symbol="MUSD")
@@ -27,8 +152,287 @@ class CustomUnits:
     def get_units_dict(self):
         return self.custom_units
 
+    def register(self, name, definition=None, symbol=None):
+        """Register a custom unit, safe to call from multiple threads.
+
+        Args:
+            name: unit name used in unit strings, e.g. "EUR".
+            definition: (optional) quantity the unit is defined by, e.g.
+                1.1 * units.USD, a new base unit is created if not provided.
+            symbol: (optional) unit symbol, defaults to name.
+
+        Returns:
+            the registered UnitQuantity, or the existing unit if name is
+            already registered
+        """
+        with self._lock:
+            unit = self.custom_units.get(name)
+            if unit is None:
+                if definition is None:
+                    unit = qs.UnitQuantity(name, symbol=symbol or name)
+                else:
+                    unit = qs.UnitQuantity(name, definition, symbol=symbol or name)
+                self.custom_units[name] = unit
+                # cached strings could contain the new unit name
+                self._dimensionality_cache = {}
+                self._conversion_cache = {}
+            return unit
+
+    def get_dimensionality(self, sunits):
+        """Return the parsed units of a normalized unit string, cached so unit
+        strings are only parsed once."""
+        dimensionality = self._dimensionality_cache.get(sunits)
+        if dimensionality is None:
+            unit = self.custom_units.get(sunits, sunits)
+            dimensionality = qs.Quantity(1.0, unit).dimensionality
+            self._dimensionality_cache[sunits] = dimensionality
+        return dimensionality
+
+    def get_conversion(self, source_units, target_units):
+        """Return (factor, offset) converting values in normalized
+        source_units to target_units as value * factor + offset, cached per
+        unit pair. Raises ValueError if the units are not compatible."""
+        key = (source_units, target_units)
+        conversion = self._conversion_cache.get(key)
+        if conversion is None:
+            source = self.get_dimensionality(source_units)
+            target = self.get_dimensionality(target_units)
+            if target_units == "degC" and str(source) == "K":
+                # quantities does not apply temperature offsets
+                conversion = (1.0, -273.15)
+            else:
+                conversion = (
+                    float(qs.Quantity(1.0, source).rescale(target).magnitude),
+                    0.0,
+                )
+            self._conversion_cache[key] = conversion
+        return conversion
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_dimensionality_cache"] = {}
+        state["_conversion_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __reduce__(self):
+        if self is _default_units:
+            # unpickles to the default units of the receiving process
+            return (get_default_units, ())
+        return super().__reduce__()
+
+
+_default_units = None
+_default_units_lock = threading.Lock()
+
+
+def get_default_units():
+    """Return the CustomUnits instance shared by all PsData in this process."""
+    global _default_units
+    if _default_units is None:
+        with _default_units_lock:
+            if _default_units is None:
+                _default_units = CustomUnits()
+    return _default_units
+
+
+class LazyLoadBudget:
+    """Tracks memory used by lazily loaded PsData arrays.
+
+    When the total size of loaded arrays exceeds *max_bytes*, arrays of the
+    oldest loaded PsData objects are released and will be re-read from file
+    on next access.  PsData that were modified after loading (e.g. through
+    to_units or mask_data) are never released.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.loaded_bytes = 0
+        self._loaded = OrderedDict()
+
+    def register(self, ps_data, nbytes):
+        key = id(ps_data)
+        if key in self._loaded:
+            self.loaded_bytes -= self._loaded.pop(key)[1]
+        self._loaded[key] = (weakref.ref(ps_data), nbytes)
+        self.loaded_bytes += nbytes
+        self.enforce()
+
+    def release(self, ps_data):
+        entry = self._loaded.pop(id(ps_data), None)
+        if entry is not None:
+            self.loaded_bytes -= entry[1]
+
+    def enforce(self):
+        if self.max_bytes is None:
+            return
+        # most recently loaded data is always kept
+        for key in list(self._loaded.keys())[:-1]:
+            if self.loaded_bytes <= self.max_bytes:
+                break
+            ref, nbytes = self._loaded[key]
+            ps_data = ref()
+            if ps_data is None:
+                del self._loaded[key]
+                self.loaded_bytes -= nbytes
+            elif ps_data._release_lazy_data():
+                _logger.debug("Released lazy data for {}".format(ps_data.data_key))
+        if self.loaded_bytes > self.max_bytes:
+            _logger.debug(
+                "Lazy data budget exceeded, {} bytes are held by modified data".format(
+                    self.loaded_bytes
+                )
+            )
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        # loaded data is not tracked in the receiving process
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
+
+
+# index selections covering at least this fraction of the rows they span are
+# read as one hyperslab and selected in memory, h5py point selections are
+# much slower than reading the covering rows
+_DENSE_SELECTION = 0.01
+
+
+def read_rows(source, selection):
+    """Return rows of *source* (e.g. an h5py.Dataset) for a selection from
+    :class:`LazyArray`, dense index selections are read as the covering
+    hyperslab and selected in memory."""
+    if isinstance(selection, np.ndarray) and len(selection) > 0:
+        start, stop = int(selection[0]), int(selection[-1]) + 1
+        if len(selection) >= _DENSE_SELECTION * (stop - start):
+            return np.asarray(source[start:stop])[selection - start]
+    return source[selection]
+
+
+class LazyArray:
+    """Deferred handle to an array stored in a data file.
+
+    The *source* can be any object that supports ``source[()]`` to read the
+    full array and exposes ``shape`` (e.g. an ``h5py.Dataset``).  PsData
+    constructed with a LazyArray only reads it when the data is accessed.
+    An optional *selection* (slice or increasing index array) limits the
+    read to those rows.
+    """
+
+    def __init__(self, source, budget=None, selection=()):
+        self.source = source
+        self.budget = budget
+        self.selection = selection
+
+    @property
+    def shape(self):
+        if isinstance(self.selection, slice):
+            num_rows = len(range(*self.selection.indices(self.source.shape[0])))
+            return (num_rows,) + tuple(self.source.shape[1:])
+        if isinstance(self.selection, np.ndarray):
+            return (len(self.selection),) + tuple(self.source.shape[1:])
+        return self.source.shape
+
+    def read(self):
+        return read_rows(self.source, self.selection)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.source, h5py.Dataset):
+            # open datasets can not be pickled, the file is re-opened when
+            # the data is read in the receiving process
+            state["source"] = PooledDataset.from_dataset(self.source)
+        return state
+
+
+@functools.lru_cache(maxsize=1024)
+def _normalize_unit_string(units):
+    """returns unit string with aliases (USD_2018, gal, PSI, ...) replaced by
+    units known to quantities, cached as the same strings repeat"""
+    # Regex-based token replacements.  Each pattern uses look-behind
+    # and look-ahead so that only *whole* unit tokens are matched —
+    # the token must be bounded by start/end of string or by one of
+    # the unit-separator characters: /  *  **
+    #
+    # (?<![A-Za-z0-9_]) — not preceded by an alphanumeric or _
+    # (?![A-Za-z0-9_])  — not followed  by an alphanumeric or _
+    _LB = r"(?<![A-Za-z0-9_])"  # look-behind boundary
+    _LA = r"(?![A-Za-z0-9_])"  # look-ahead  boundary
+
+    # USD_XXXX variants → USD  (e.g. USD_2018, USD_2020)
+    units = re.sub(_LB + r"USD(?:_\w+)?" + _LA, "USD", units)
+
+    # "a" meaning year — only when it stands alone as a unit token
+    units = re.sub(_LB + r"a" + _LA, "year", units)
+
+    # PSI → psi
+    units = re.sub(_LB + r"PSI" + _LA, "psi", units)
+
+    # gpm → US_liquid_gallon/min  (before gal, since gpm contains "gal")
+    units = re.sub(_LB + r"gpm" + _LA, "US_liquid_gallon/min", units)
+
+    # gal → US_liquid_gallon (whole-token only, won't match "gallon")
+    units = re.sub(_LB + r"gal" + _LA, "US_liquid_gallon", units)
+
+    # °C → *degC
+    units = units.replace(" °C", "*degC").replace("°C", "degC")
+
+    # liter → L (whole-token)
+    units = re.sub(_LB + r"liter" + _LA, "L", units)
+
+    # sec → s (whole-token only, won't match "second")
+    units = re.sub(_LB + r"sec" + _LA, "s", units)
+    return units
+
 
 class PsData:
+    # many small PsData are created by costing and expressions, so attributes
+    # are slots and unit arrays and labels are only built when used
+    __slots__ = (
+        "data_key",
+        "data_type",
+        "data_directory",
+        "data_label",
+        "sunits",
+        "data_is_numbers",
+        "feasible_indexes",
+        "key_index",
+        "key_index_str",
+        "row_indexes",
+        "_convert_iso_to_epoch",
+        "_lazy_source",
+        "_lazy_modified",
+        "_import_options",
+        "storage_dtype",
+        "_units",
+        "_original_data",
+        "_raw_data",
+        "_raw_data_array",
+        "_data_array",
+        "_data_with_units",
+        "_raw_data_with_units",
+        # set by PsDataManager.add_data
+        "_PsDataManager__key",
+        "_PsDataManager__dir_key",
+        # other attributes (e.g. filter_type of index data) are kept in a
+        # dict that is only created when used
+        "__dict__",
+        "__weakref__",
+    )
+
     def __init__(
         self,
         data_key,
@@ -42,6 +446,8 @@ class PsData:
         data_label=None,
         custom_units=None,
         data_directory=None,
+        copy=True,
+        storage_dtype=None,
         **kwargs,
     ):
         """
@@ -58,8 +464,21 @@ class PsData:
         PsData.convert_units('new_unit')
         to assigne any unit
         PsData.assign_units(new_unit,manual_conversion_factor)
+
+        data, raw data, original data and their unit arrays are read-only views of
+        one buffer, conversions and masks create new arrays instead of modifying it,
+        unit arrays are built on first access
+        copy: (optional) if False, data_array is used as the buffer without copying,
+        only pass arrays that are not modified elsewhere
+        storage_dtype: (optional) float dtype float data is stored as, e.g. "float32"
+            or "float16" to reduce memory use, float16 data is computed in float32
         """
         self._define_custom_units(custom_units)
+        if storage_dtype is not None:
+            storage_dtype = np.dtype(storage_dtype).name
+        self.storage_dtype = storage_dtype
+        self._data_with_units = None
+        self._raw_data_with_units = None
         self.data_key = data_key
         self.data_type = data_type
         self._convert_iso_to_epoch = False
@@ -74,27 +493,240 @@ class PsData:
             data_array = data_array.magnitude
         self.sunits = self._convert_string_unit(import_units)
         self.data_is_numbers = True
-        self._original_data = np.array(data_array).copy()
-        self._raw_data = self._original_data.copy()
+        self.feasible_indexes = feasible_indexes
+        self.key_index = None
+        self.key_index_str = None
+        # file rows of imported data, None if all rows were imported
+        self.row_indexes = None
+        self._lazy_source = None
+        self._lazy_modified = False
+        # kept so data re-read or extended from file gets the same conversions
+        self._import_options = (self.sunits, assign_units, conversion_factor, units)
+        if isinstance(data_array, LazyArray) and self._convert_iso_to_epoch:
+            data_array = data_array.read()
+        if isinstance(data_array, LazyArray):
+            # validate units on a placeholder so unit errors surface at import,
+            # the real array is read on first access
+            self._set_data_array(np.ones(1), assign_units, conversion_factor, units)
+            self._lazy_source = data_array
+            self._lazy_modified = False
+            self._release_lazy_data()
+        else:
+            self._set_data_array(
+                data_array, assign_units, conversion_factor, units, copy=copy
+            )
+
+    def _set_data_array(
+        self, data_array, assign_units, conversion_factor, units, copy=False
+    ):
+        array = np.asarray(data_array)
+        stored = self._to_storage_dtype(array)
+        if stored is array and copy and isinstance(data_array, np.ndarray):
+            stored = array.copy()
+        array = stored
+        self._original_data = _read_only_view(array)
+        self._raw_data = self._original_data
         if self._convert_iso_to_epoch:
-            data_array = np.array(self._iso_to_epoch(data_array))
-        if isinstance(data_array, list):
+            data_array = _read_only_view(np.array(self._iso_to_epoch(data_array)))
+        elif isinstance(data_array, list):
             try:
                 data_array = np.array(data_array, dtype=float)
             except:
                 data_array = np.array(data_array, dtype=str)
                 self.data_is_numbers = False
-        self.raw_data = data_array.copy()
-        self.data = data_array.copy()
-        self.feasible_indexes = feasible_indexes
+            data_array = _read_only_view(self._to_storage_dtype(data_array))
+        else:
+            data_array = self._original_data
+        self.raw_data = data_array
+        self.data = data_array
         self._assign_units()
-        self.key_index = None
-        self.key_index_str = None
         if assign_units != None:
             self.assign_units(assign_units, conversion_factor)
         if units != None:
             self.to_units(units)
 
+    def _to_storage_dtype(self, array):
+        """returns float array cast to the storage dtype, data that exceeds
+        the range of the storage dtype is stored in the next wider dtype"""
+        if (
+            self.storage_dtype is None
+            or array.dtype.kind != "f"
+            or array.dtype == self.storage_dtype
+        ):
+            return array
+        result = _cast_float(array, self.storage_dtype)
+        if result is None:
+            wider = "float32" if np.dtype(self.storage_dtype).itemsize < 4 else None
+            result = None if wider is None else _cast_float(array, wider)
+            if result is None:
+                wider = "float64"
+                result = array.astype(np.float64)
+            _logger.warning(
+                "Data of data_key='{}' exceeds the range of {}, it is stored "
+                "as {} instead".format(self.data_key, self.storage_dtype, wider)
+            )
+            self.storage_dtype = wider
+        return result
+
+    def __getattr__(self, name):
+        # only called when regular lookup fails, e.g. array data of a lazily
+        # imported PsData that has not been read yet
+        if name in _LAZY_ATTRIBUTES and _get_slot(self, "_lazy_source") is not None:
+            self._load_lazy_data()
+            return object.__getattribute__(self, name)
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(type(self).__name__, name)
+        )
+
+    @property
+    def is_loaded(self):
+        """False if this PsData was imported lazily and its data has not been
+        read from file yet (or was released by a memory budget)."""
+        return _get_slot(self, "_data_array") is not None
+
+    def _get_attributes(self):
+        """Return dict of set attributes with public names, unit arrays are
+        included if data is loaded."""
+        skipped = ("__dict__", "__weakref__") + tuple(u[1] for u in _UNIT_ARRAYS)
+        attributes = {}
+        for name in PsData.__slots__:
+            value = _get_slot(self, name, _MISSING)
+            if name not in skipped and value is not _MISSING:
+                attributes[_STATE_NAMES.get(name, name)] = value
+        if self.is_loaded:
+            for name, _, _ in _UNIT_ARRAYS:
+                attributes[name] = getattr(self, name)
+        attributes.update(_get_slot(self, "__dict__", {}))
+        return attributes
+
+    def __getstate__(self):
+        """Arrays that can be re-read from file are not pickled, unit arrays
+        that are views of the data are rebuilt on unpickling and arrays in
+        shared memory are pickled as a reference to their block."""
+        state = self._get_attributes()
+        for name, _, array_slot in _UNIT_ARRAYS:
+            if is_same_view(state.get(_STATE_NAMES[array_slot]), state.get(name)):
+                del state[name]
+        if state.get("_units") is get_default_units():
+            # restored as the default units of the receiving process
+            del state["_units"]
+        if (
+            self._lazy_source is not None
+            and not self._lazy_modified
+            and get_shared_reference(state.get("data")) is None
+        ):
+            for name in _ARRAY_SLOTS:
+                state.pop(_STATE_NAMES.get(name, name), None)
+            for name, _, _ in _UNIT_ARRAYS:
+                state.pop(name, None)
+            return state
+        for name in state:
+            reference = get_shared_reference(state[name])
+            if reference is not None:
+                state[name] = reference
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled state or a state saved by ps_snapshot."""
+        state = dict(state)
+        for name in _DERIVED_ATTRIBUTES:
+            state.pop(name, None)
+        state.setdefault("_units", get_default_units())
+        state.setdefault("storage_dtype", None)
+        unit_arrays = {name: state.pop(name, None) for name, _, _ in _UNIT_ARRAYS}
+        self._data_with_units = None
+        self._raw_data_with_units = None
+        for name, value in state.items():
+            if isinstance(value, SharedArrayReference):
+                value = value.attach()
+            setattr(self, name, value)
+        for name, value in unit_arrays.items():
+            if isinstance(value, SharedArrayReference):
+                value = value.attach()
+            if value is not None:
+                setattr(self, name, value)
+
+    def _load_lazy_data(self):
+        import_units, assign_units, conversion_factor, units = self._import_options
+        self.sunits = import_units
+        self._set_data_array(
+            self._lazy_source.read(), assign_units, conversion_factor, units
+        )
+        self._lazy_modified = False
+        if self._lazy_source.budget is not None:
+            self._lazy_source.budget.register(self, self.nbytes)
+
+    def extend_data(self, data_array, feasible_indexes=None):
+        """Append rows read from file (e.g. new points of a running sweep) to
+        imported data. Import unit options are re-applied to the combined data,
+        so unit conversions or masks applied after import are reset.
+
+        Args:
+            data_array: new rows in file units, appended along the first axis.
+            feasible_indexes: (optional) feasibility mask for the combined data.
+        """
+        if not self.is_loaded:
+            self._load_lazy_data()
+        import_units, assign_units, conversion_factor, units = self._import_options
+        self.sunits = import_units
+        self._set_data_array(
+            np.concatenate([self._original_data, np.asarray(data_array)]),
+            assign_units,
+            conversion_factor,
+            units,
+        )
+        if feasible_indexes is not None:
+            self.feasible_indexes = feasible_indexes
+        self._lazy_modified = False
+
+    @property
+    def nbytes(self):
+        """Bytes held by the array data, arrays sharing a buffer are counted
+        once."""
+        buffers = {}
+        for name in _ARRAY_SLOTS:
+            array = _get_slot(self, name)
+            if isinstance(array, np.ndarray):
+                base = array
+                while isinstance(base.base, np.ndarray):
+                    base = base.base
+                buffers[id(base)] = base.nbytes
+        return sum(buffers.values())
+
+    def _map_arrays(self, function):
+        """Replace each array by function(array), arrays that are the same
+        object stay the same object and unit arrays that are views of the
+        data are rebuilt on access."""
+        mapped = {}
+        views = {}
+        for _, unit_slot, array_slot in _UNIT_ARRAYS:
+            quantity = _get_slot(self, unit_slot)
+            views[unit_slot] = is_same_view(_get_slot(self, array_slot), quantity)
+        for name in _ARRAY_SLOTS + tuple(u[1] for u in _UNIT_ARRAYS):
+            array = _get_slot(self, name)
+            if array is None:
+                continue
+            if views.get(name):
+                object.__setattr__(self, name, None)
+                continue
+            if id(array) not in mapped:
+                mapped[id(array)] = function(array)
+            object.__setattr__(self, name, mapped[id(array)])
+
+    def _release_lazy_data(self):
+        """Drop array data of a lazily imported PsData so it is re-read on next
+        access, returns False if data can not be released"""
+        if self._lazy_source is None or self._lazy_modified:
+            return False
+        for name in _ARRAY_SLOTS:
+            if _get_slot(self, name, _MISSING) is not _MISSING:
+                object.__delattr__(self, name)
+        self._data_with_units = None
+        self._raw_data_with_units = None
+        if self._lazy_source.budget is not None:
+            self._lazy_source.budget.release(self)
+        return True
+
     def get_data(self, exclude_nan_values=False):
         if exclude_nan_values:
             return self.data[~np.isnan(self.data)]
@@ -125,26 +757,26 @@ class PsData:
         errors"""
         if feasible_only:
             if self.raw_data.shape == self.feasible_indexes.shape:
-                self.data = self.raw_data.copy()[self.feasible_indexes]
-                self._raw_data = self._original_data.copy()[self.feasible_indexes]
+                self.data = self.raw_data[self.feasible_indexes]
+                self._raw_data = self._original_data[self.feasible_indexes]
                 self._assign_units()
         if user_filter is not None:
             if user_filter.filter_type == "2D":
-                self.data = self.raw_data.copy()
+                self.data = self.raw_data
                 try:
                     self.data = self._take_along(self.data, user_filter.data)
                 except:
                     pass
 
-                self._raw_data = self._original_data.copy()
+                self._raw_data = self._original_data
                 try:
                     self._raw_data = self._take_along(self._raw_data, user_filter.data)
                 except:
                     pass
                 self._assign_units()
             elif user_filter.filter_type == "1D":
-                self.data = self.raw_data.copy()[user_filter.data]
-                self._raw_data = self._original_data.copy()[user_filter.data]
+                self.data = self.raw_data[user_filter.data]
+                self._raw_data = self._original_data[user_filter.data]
                 self._assign_units()
             else:
                 _logger.debug(
@@ -152,6 +784,8 @@ class PsData:
                         user_filter.filter_type, user_filter.filter_data_shape
                     )
                 )
+        if feasible_only or user_filter is not None:
+            self._lazy_modified = True
 
     def _take_along(self, data, idxs):
         reduced_data = []
@@ -166,8 +800,12 @@ class PsData:
 
     def _define_custom_units(self, custom_units=None):
         if custom_units is None:
-            custom_units = CustomUnits()
-        self.custom_units = custom_units.get_units_dict()
+            custom_units = get_default_units()
+        self._units = custom_units
+
+    @property
+    def custom_units(self):
+        return self._units.get_units_dict()
 
     def _raise_unit_error(self, error, operation, requested_units=None, other=None):
         """Build and raise an enhanced unit error preserving the original type.
@@ -194,16 +832,64 @@ class PsData:
         raise type(error)(msg) from error
 
     def _assign_units(self, manual_conversion=1):
-        if self.data_is_numbers:
-            self.data = self.data * manual_conversion
-        qsunits = self._get_qs_unit()
+        # multiplying by 1 would only copy the data (bool data becomes int)
+        if self.data_is_numbers and (
+            manual_conversion != 1 or self.data.dtype.kind == "b"
+        ):
+            if self.data.dtype.kind == "f":
+                self.data = _convert(self.data, manual_conversion)
+            else:
+                self.data = self.data * manual_conversion
         try:
-            self.data_with_units = qs.Quantity(self.data.copy(), qsunits)
-            self.raw_data_with_units = qs.Quantity(self.raw_data.copy(), qsunits)
-            self.data = self.data_with_units.magnitude
+            # validates units, unit arrays are built on access
+            self._get_qs_unit()
         except (ValueError, LookupError) as e:
             self._raise_unit_error(e, "assign units", requested_units=self.sunits)
-        self.set_label()
+        self._data_with_units = None
+        self._raw_data_with_units = None
+
+    @property
+    def data(self):
+        return self._data_array
+
+    @data.setter
+    def data(self, value):
+        self._data_array = value
+        self._data_with_units = None
+
+    @property
+    def raw_data(self):
+        return self._raw_data_array
+
+    @raw_data.setter
+    def raw_data(self, value):
+        self._raw_data_array = value
+        self._raw_data_with_units = None
+
+    @property
+    def data_with_units(self):
+        """data as quantities array, a view of data built on first access"""
+        data = self.data
+        if self._data_with_units is None:
+            # quantities>=0.16 does not copy the data
+            self._data_with_units = qs.Quantity(data, self._get_qs_unit())
+        return self._data_with_units
+
+    @data_with_units.setter
+    def data_with_units(self, value):
+        self._data_with_units = value
+
+    @property
+    def raw_data_with_units(self):
+        """raw_data as quantities array, built on first access"""
+        raw_data = self.raw_data
+        if self._raw_data_with_units is None:
+            self._raw_data_with_units = qs.Quantity(raw_data, self._get_qs_unit())
+        return self._raw_data_with_units
+
+    @raw_data_with_units.setter
+    def raw_data_with_units(self, value):
+        self._raw_data_with_units = value
 
     @property
     def udata(self):
@@ -226,36 +912,14 @@ class PsData:
     def set_label(self, label=None):
         if label != None:
             self.data_label = label
-        units = self.sunits
-        if "**" in self.sunits:
-            uf = units.split("/")
-            for i, u in enumerate(uf):
-                if "**" in u:
-                    u_t = u.replace("**", "^")
-                    uf[i] = "${}$".format(u_t)
-                if u == "USD":
-                    uf[i] = "$\$$"
-                elif u == "kUSD":
-                    uf[i] = "k$\$$"
-                elif u == "MUSD":
-                    uf[i] = "M$\$$"
-
-            units = "/".join(uf)
-        if "dimensionless" in self.sunits:
-            units = "-"
-        self.mpl_units = units
+
+    @property
+    def mpl_units(self):
+        """units label for matplotlib, derived from sunits"""
+        return _get_mpl_units(self.sunits)
 
     def _get_qs_unit(self):
-        if self.sunits not in self.custom_units:
-            try:
-                qsunits = self.sunits
-            except LookupError:
-                # _logger.info("created custom unit {}".format(self.sunits))
-                self.custom_units[self.sunits] = qs.UnitQuantity(self.sunits)
-                qsunits = self.custom_units[self.sunits]
-        else:
-            qsunits = self.custom_units[self.sunits]
-        return qsunits
+        return self._units.get_dimensionality(self.sunits)
 
     def _convert_string_unit(self, units):
         if units is None or units == "-":
@@ -264,72 +928,33 @@ class PsData:
             _logger.info("Imported ISO time - converted to epoch time in min")
             self._convert_iso_to_epoch = True
             return "min"
-
-        # Regex-based token replacements.  Each pattern uses look-behind
-        # and look-ahead so that only *whole* unit tokens are matched —
-        # the token must be bounded by start/end of string or by one of
-        # the unit-separator characters: /  *  **
-        #
-        # (?<![A-Za-z0-9_]) — not preceded by an alphanumeric or _
-        # (?![A-Za-z0-9_])  — not followed  by an alphanumeric or _
-        _u = units
-        _LB = r"(?<![A-Za-z0-9_])"  # look-behind boundary
-        _LA = r"(?![A-Za-z0-9_])"  # look-ahead  boundary
-
-        # USD_XXXX variants → USD  (e.g. USD_2018, USD_2020)
-        units = re.sub(_LB + r"USD(?:_\w+)?" + _LA, "USD", units)
-
-        # "a" meaning year — only when it stands alone as a unit token
-        units = re.sub(_LB + r"a" + _LA, "year", units)
-
-        # PSI → psi
-        units = re.sub(_LB + r"PSI" + _LA, "psi", units)
-
-        # gpm → US_liquid_gallon/min  (before gal, since gpm contains "gal")
-        units = re.sub(_LB + r"gpm" + _LA, "US_liquid_gallon/min", units)
-
-        # gal → US_liquid_gallon (whole-token only, won't match "gallon")
-        units = re.sub(_LB + r"gal" + _LA, "US_liquid_gallon", units)
-
-        # °C → *degC
-        units = units.replace(" °C", "*degC").replace("°C", "degC")
-
-        # liter → L (whole-token)
-        units = re.sub(_LB + r"liter" + _LA, "L", units)
-
-        # sec → s (whole-token only, won't match "second")
-        units = re.sub(_LB + r"sec" + _LA, "s", units)
-        # print("units after conversion: {} -> {}".format(_u, units))
-        return units
+        return _normalize_unit_string(units)
 
     def set_data(self, data):
+        if not self.is_loaded:
+            self._load_lazy_data()
+        self._lazy_modified = True
         self.data = data
         self.raw_data = data
 
     def to_units(self, new_units):
         converted_units = self._convert_string_unit(new_units)
-        old_sunits = self.sunits
-        self.sunits = converted_units
-        qsunits = self._get_qs_unit()
         try:
-            if new_units == "degC" and str(self.data_with_units.units) == "1.0 K":
-                self.data_with_units = qs.Quantity(
-                    self.data_with_units.magnitude[:] - 273.15, new_units
-                )
-            else:
-                self.data_with_units = self.data_with_units.rescale(qsunits)
-            self.raw_data_with_units = self.raw_data_with_units.rescale(qsunits)
+            # cached per unit pair, so converting is one multiply per array
+            factor, offset = self._units.get_conversion(self.sunits, converted_units)
         except (ValueError, LookupError) as e:
-            self.sunits = old_sunits
             self._raise_unit_error(e, "convert units", requested_units=new_units)
-        self.data = self.data_with_units.magnitude[:]
-        self.raw_data = self.raw_data_with_units.magnitude
-        self.set_label()
+        self.sunits = converted_units
+        self.data = _convert(self.data, factor, offset)
+        # offsets are not applied to raw data
+        self.raw_data = _convert(self.raw_data, factor)
+        self._lazy_modified = True
         return self
 
     def assign_units(self, assigned_units, manual_conversion_factor=1):
         self.sunits = self._convert_string_unit(assigned_units)
         self._assign_units(manual_conversion=manual_conversion_factor)
+        self._lazy_modified = True
 
     def display(self):
         _logger.info("Data: {}, units {}".format(self.data, self.sunits))
@@ -372,7 +997,7 @@ class PsData:
             symbol: string like '+', '-', '*', '/', '**' used in the result data_key.
         """
         if isinstance(other, PsData):
-            other_val = other.data_with_units
+            other_val = _upcast(other.data_with_units)
             other_label = other.data_key
         elif isinstance(other, (int, float, np.integer, np.floating)):
             other_val = other
@@ -383,7 +1008,7 @@ class PsData:
                 "scalar, got {}".format(type(other))
             )
         try:
-            result_quantity = op(self.data_with_units, other_val)
+            result_quantity = op(_upcast(self.data_with_units), other_val)
         except (ValueError, LookupError) as e:
             self._raise_unit_error(e, "arithmetic '{}'".format(symbol), other=other)
         result_key = "({} {} {})".format(self.data_key, symbol, other_label)
@@ -391,6 +1016,8 @@ class PsData:
             data_key=result_key,
             data_type="arithmetic_result",
             data_array=result_quantity,
+            copy=False,
+            storage_dtype=get_storage_dtype(self, other),
         )
 
     def _r_arithmetic_op(self, other, op, symbol):
@@ -408,7 +1035,7 @@ class PsData:
                 "scalar, got {}".format(type(other))
             )
         try:
-            result_quantity = op(other_val, self.data_with_units)
+            result_quantity = op(other_val, _upcast(self.data_with_units))
         except (ValueError, LookupError) as e:
             self._raise_unit_error(
                 e, "reflected arithmetic '{}'".format(symbol), other=other
@@ -418,6 +1045,8 @@ class PsData:
             data_key=result_key,
             data_type="arithmetic_result",
             data_array=result_quantity,
+            copy=False,
+            storage_dtype=self.storage_dtype,
         )
 
     def __add__(self, other):
@@ -454,12 +1083,14 @@ class PsData:
         to an array of non-uniform exponents.
         """
         if isinstance(other, (int, float, np.integer, np.floating)):
-            result_data = other**self.data
+            result_data = other ** _upcast(self.data)
             result_key = "({} ** {})".format(other, self.data_key)
             return PsData(
                 data_key=result_key,
                 data_type="arithmetic_result",
                 data_array=result_data,
+                copy=False,
+                storage_dtype=self.storage_dtype,
             )
         raise TypeError(
             "Arithmetic operations require a PsData object or numeric "
@@ -468,7 +1099,7 @@ class PsData:
 
     def __neg__(self):
         try:
-            result_quantity = -1 * self.data_with_units
+            result_quantity = -1 * _upcast(self.data_with_units)
         except (ValueError, LookupError) as e:
             self._raise_unit_error(e, "negation")
         result_key = "(-{})".format(self.data_key)
@@ -476,4 +1107,6 @@ class PsData:
             data_key=result_key,
             data_type="arithmetic_result",
             data_array=result_quantity,
+            copy=False,
+            storage_dtype=self.storage_dtype,
         )
@@ -1,13 +1,21 @@
 import numpy as np
 from psPlotKit.util.logger import define_logger
 import quantities as qs
-from psPlotKit.data_manager.ps_data import PsData
+from psPlotKit.data_manager.ps_data import PsData, LazyLoadBudget, get_storage_dtype
 from psPlotKit.data_manager.data_importer import PsDataImport
+from psPlotKit.data_manager.sharded_import import ShardedDataImport
+from psPlotKit.data_manager.h5_handle_pool import H5HandlePool
+from psPlotKit.data_manager.shared_arrays import SharedArrayStore
+from psPlotKit.data_manager.ps_snapshot import save_snapshot, load_snapshot
+from psPlotKit.data_manager.ps_key_table import KeyTable
 from psPlotKit.data_manager.ps_costing_tool import PsCosting
 import copy
+import glob
+import os
+import time
 import yaml
 import warnings
-import difflib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from psPlotKit.data_manager.ps_expression import ExpressionNode, ExpressionKeys
 
 __author__ = "Alexander V. Dudchenko "
@@ -15,8 +23,92 @@ __author__ = "Alexander V. Dudchenko "
 _logger = define_logger(__name__, "PsDataManager", level="INFO")
 
 
+class _ImportCollector:
+    """Stand-in for PsDataManager passed to PsDataImport.get_data during
+    parallel imports, records imported data so it can be merged into the
+    manager in a deterministic order"""
+
+    def __init__(self):
+        self.entries = []
+
+    def add_data(self, dir_key, data_key, data):
+        self.entries.append((dir_key, data_key, data))
+
+
+def _import_instance_data(instance, get_data_kwargs):
+    collector = _ImportCollector()
+    instance.get_data(PsDataManager=collector, **get_data_kwargs)
+    return collector.entries
+
+
+def _import_detached_instance_data(instance, get_data_kwargs):
+    """process pool worker, the pickled instance keeps its file index and
+    re-opens its file on first access"""
+    if isinstance(instance, PsDataImport):
+        instance.lazy_load = False
+        instance.memory_budget = None
+    return _import_instance_data(instance, get_data_kwargs)
+
+
 class PsDataManager(dict):
-    def __init__(self, data_files=None):
+    def __init__(
+        self,
+        data_files=None,
+        lazy_load=False,
+        memory_budget=None,
+        index_cache=False,
+        stream_json=False,
+        swmr=False,
+        max_open_files=None,
+        chunk_cache=None,
+        shared_memory=False,
+        storage_dtype=None,
+    ):
+        """
+        data_files: (optional) path or list of paths to .h5 or .json files, list entries
+            can also be dicts with "file" and "return_directory" keys, a glob pattern or
+            list of shard files is imported as one data source
+        lazy_load: (optional) if True, h5 data is read only when first accessed
+            instead of during load_data
+        memory_budget: (optional) max bytes of lazily loaded data kept in memory
+            across all files, oldest loaded data is released and re-read on access
+        index_cache: (optional) if True, file indexes are cached next to each data
+            file and reused while the file is unchanged, can also be a folder path
+            in which to store the cache files
+        stream_json: (optional) if True, .json files are streamed and only the
+            imported keys are parsed, instead of loading the whole file
+        swmr: (optional) if True, .h5 files are opened in single writer multiple
+            reader mode, to read files of sweeps that are still running, see poll
+        max_open_files: (optional) max number of .h5 files kept open at the same time,
+            files are opened through a shared H5HandlePool which closes the least
+            recently used file and re-opens it on next access, can be a H5HandlePool
+            to share one pool between managers
+        chunk_cache: (optional) dict with h5py chunk cache options (rdcc_nbytes,
+            rdcc_nslots, rdcc_w0) used for all .h5 files, can be set per file with
+            register_data_file or a "chunk_cache" entry in data_files
+        shared_memory: (optional) if True, arrays of added data are placed in shared
+            memory blocks, so worker processes that receive this manager get read-only
+            views instead of copies, see share_memory and free_shared_memory
+        storage_dtype: (optional) dtype imported float data is stored as, e.g. "float32"
+            to halve memory of large sweeps, can be set per key with register_data_key,
+            stacked data and expression results keep the widest dtype of their inputs
+        """
+        if memory_budget is not None and not isinstance(memory_budget, LazyLoadBudget):
+            memory_budget = LazyLoadBudget(memory_budget)
+        if max_open_files is not None and not isinstance(max_open_files, H5HandlePool):
+            max_open_files = H5HandlePool(max_open_files)
+        self._import_options = {
+            "lazy_load": lazy_load,
+            "memory_budget": memory_budget,
+            "index_cache": index_cache,
+            "stream_json": stream_json,
+            "swmr": swmr,
+            "handle_pool": max_open_files,
+            "chunk_cache": chunk_cache,
+            "storage_dtype": storage_dtype,
+        }
+        self.shared_arrays = SharedArrayStore() if shared_memory else None
+        self._key_table = KeyTable()
         self.directory_keys = []
         self.data_keys = []
         self.selected_directories = []
@@ -31,33 +123,81 @@ class PsDataManager(dict):
         self.global_reduction_directory = None
         self._registered_key_import_status = {}
         self._registered_expressions = []
+        self._last_get_data_kwargs = None
         self._expression_keys = None
         self.auto_evaluate_expressions = True
         self.PsDataImportInstances = []
         self._registered_data_files = []
         if data_files is not None:
             if isinstance(data_files, str):
-                self.PsDataImportInstances.append(PsDataImport(data_files))
+                self.PsDataImportInstances.append(
+                    self._create_import_instance(data_files)
+                )
             else:
                 for df in data_files:
-                    if isinstance(df, str):
-                        self.PsDataImportInstances.append(PsDataImport(df))
+                    if isinstance(df, (str, list)):
+                        self.PsDataImportInstances.append(
+                            self._create_import_instance(df)
+                        )
                     else:
                         directory = df["return_directory"]
                         file_loc = df["file"]
                         self.PsDataImportInstances.append(
-                            PsDataImport(file_loc, default_return_directory=directory)
+                            self._create_import_instance(
+                                file_loc,
+                                directory,
+                                df.get("sort_key"),
+                                df.get("chunk_cache"),
+                            )
                         )
 
-    def register_data_file(self, file_location, directory=None):
+    def _create_import_instance(
+        self, file_location, directory=None, sort_key=None, chunk_cache=None
+    ):
+        """Create a :class:`PsDataImport` using the manager import options, or a
+        :class:`ShardedDataImport` for a glob pattern or list of shard files,
+        existing files are never treated as patterns (e.g. run[1].h5)."""
+        import_options = dict(self._import_options)
+        if chunk_cache is not None:
+            import_options["chunk_cache"] = chunk_cache
+        if isinstance(file_location, list) or (
+            not os.path.exists(file_location) and glob.has_magic(file_location)
+        ):
+            return ShardedDataImport(
+                file_location,
+                default_return_directory=directory,
+                sort_key=sort_key,
+                **import_options,
+            )
+        return PsDataImport(
+            file_location,
+            default_return_directory=directory,
+            **import_options,
+        )
+
+    def register_data_file(
+        self, file_location, directory=None, sort_key=None, chunk_cache=None
+    ):
         """Register a data file to be imported when :meth:`load_data` is called.
 
         Args:
-            file_location: path to an ``.h5`` or ``.json`` data file.
+            file_location: path to an ``.h5`` or ``.json`` data file, or a glob
+                pattern or list of shard files that are imported as one data
+                source (see :class:`ShardedDataImport`).
             directory: (optional) default return directory label for the file.
+            sort_key: (optional) callable that orders shard files, data of
+                shards is concatenated in this order.
+            chunk_cache: (optional) dict with h5py chunk cache options for this
+                file (``rdcc_nbytes``, ``rdcc_nslots``, ``rdcc_w0``), overrides
+                the manager ``chunk_cache``.
         """
         self._registered_data_files.append(
-            {"file": file_location, "directory": directory}
+            {
+                "file": file_location,
+                "directory": directory,
+                "sort_key": sort_key,
+                "chunk_cache": chunk_cache,
+            }
         )
 
     def _load_registered_data_files(self):
@@ -65,9 +205,11 @@ class PsDataManager(dict):
         and clear the registration list."""
         for entry in self._registered_data_files:
             self.PsDataImportInstances.append(
-                PsDataImport(
+                self._create_import_instance(
                     entry["file"],
-                    default_return_directory=entry["directory"],
+                    entry["directory"],
+                    entry["sort_key"],
+                    entry["chunk_cache"],
                 )
             )
         self._registered_data_files.clear()
@@ -82,6 +224,10 @@ class PsDataManager(dict):
         check_import_status=True,
         evaluate_expressions=True,
         raise_error=True,
+        num_workers=None,
+        parallel_mode="thread",
+        rows=None,
+        feasible_only=False,
     ):
         """methods for automatic retrieval of data from h5 file generated by
         ps tool or loop tool
@@ -109,26 +255,193 @@ class PsDataManager(dict):
                 check_import_status: (optional) - if True, run check_import_status after loading (default True)
                 evaluate_expressions: (optional) - if True, run evaluate_expressions after loading (default True)
                 raise_error: (optional) - if True, check_import_status will raise KeyError on missing keys (default True)
+                num_workers: (optional) - number of files to import in parallel, if None or 1 files are imported one after another,
+                    data is always merged in the order files were registered, when a single file is loaded in "thread" mode
+                    its directories are read in parallel instead
+                parallel_mode: (optional) - "thread" to import files in a thread pool, or "process" to import files in a
+                    process pool, file indexes are sent to the workers which re-open each file without re-scanning it,
+                    process workers do not support lazy_load
+                rows: (optional) - rows to import for keys registered without a rows option, a slice, boolean mask or
+                    list of row indexes, only these rows are read from h5 files
+                feasible_only: (optional) - if True, only feasible rows are imported for keys registered without
+                    a feasible_only option, see register_data_key
         """
         self._load_registered_data_files()
         if data_key_list is None:
             data_key_list = self.registered_key_list
         elif data_key_list is not None and self.registered_key_list is not None:
             data_key_list = self.registered_key_list + data_key_list
+        get_data_kwargs = {
+            "data_key_list": data_key_list,
+            "directories": directories,
+            "num_keys": num_keys,
+            "exact_keys": exact_keys,
+            "match_accuracy": match_accuracy,
+            "rows": rows,
+            "feasible_only": feasible_only,
+        }
+        self._last_get_data_kwargs = get_data_kwargs
+        if (
+            num_workers is None
+            or num_workers <= 1
+            or len(self.PsDataImportInstances) <= 1
+        ):
+            if num_workers is not None and parallel_mode == "thread":
+                # single file, so read its directories in parallel instead
+                get_data_kwargs["num_workers"] = num_workers
+            for instance in self.PsDataImportInstances:
+                instance.get_data(PsDataManager=self, **get_data_kwargs)
+        else:
+            self._parallel_import(get_data_kwargs, num_workers, parallel_mode)
+        if check_import_status:
+            self.check_import_status(raise_error=raise_error)
+        if evaluate_expressions:
+            self.evaluate_expressions()
+
+    def refresh(self, check_import_status=False, evaluate_expressions=True):
+        """Import data added to the data files since the last load_data call,
+        e.g. while a sweep is still writing its results. Files are re-scanned
+        for new directories and keys, and only rows appended to already
+        imported data sets are read, other data is left untouched.
+
+        Args:
+            check_import_status: (optional) if True, run check_import_status
+                after refreshing.
+            evaluate_expressions: (optional) if True, re-evaluate registered
+                expressions so they include the new data.
+        """
+        if self._last_get_data_kwargs is None:
+            _logger.info("No data loaded yet, loading all data")
+            self.load_data(
+                check_import_status=check_import_status,
+                evaluate_expressions=evaluate_expressions,
+            )
+            return
+        loaded_instances = list(self.PsDataImportInstances)
+        self._load_registered_data_files()
         for instance in self.PsDataImportInstances:
+            if instance in loaded_instances:
+                instance.refresh()
             instance.get_data(
-                data_key_list=data_key_list,
-                directories=directories,
-                num_keys=num_keys,
-                exact_keys=exact_keys,
-                match_accuracy=match_accuracy,
-                PsDataManager=self,
+                PsDataManager=self, refresh=True, **self._last_get_data_kwargs
             )
         if check_import_status:
-            self.check_import_status(raise_error=raise_error)
+            self.check_import_status()
         if evaluate_expressions:
             self.evaluate_expressions()
 
+    def poll(self, interval=60, num_polls=None, callback=None):
+        """Periodically refresh data from files that are still being written,
+        blocks until num_polls refreshes are done or it is interrupted
+        (KeyboardInterrupt).
+
+        Args:
+            interval: (optional) seconds between refreshes.
+            num_polls: (optional) number of refreshes, if None polls until
+                interrupted.
+            callback: (optional) called with this PsDataManager after every
+                refresh, e.g. to update a plot.
+        """
+        polls = 0
+        try:
+            while num_polls is None or polls < num_polls:
+                time.sleep(interval)
+                self.refresh()
+                polls += 1
+                if callback is not None:
+                    callback(self)
+        except KeyboardInterrupt:
+            _logger.info("Stopped polling after {} refreshes".format(polls))
+
+    def share_memory(self):
+        """Place arrays of all loaded data in shared memory, data added later
+        is placed in shared memory when it is added. Worker processes that
+        receive this manager (or its PsData) get read-only views of the arrays
+        instead of copies. Lazily imported data is shared only if it is loaded."""
+        if self.shared_arrays is None:
+            self.shared_arrays = SharedArrayStore()
+        for data in dict.values(self):
+            self.shared_arrays.share_data(data)
+        _logger.info(
+            "Placed {} bytes of data in shared memory".format(self.shared_arrays.nbytes)
+        )
+
+    def free_shared_memory(self):
+        """Free shared memory blocks of this manager. Data keeps working in
+        this process, but new workers receive copies of it, and added data is
+        no longer placed in shared memory."""
+        if self.shared_arrays is not None:
+            self.shared_arrays.free()
+            self.shared_arrays = None
+
+    def save_snapshot(self, location, compression=None):
+        """Save all data (arrays, units, labels, keys and masks) to a snapshot
+        file, which can be reopened with load_snapshot without importing the
+        data files again. Registered keys, expressions and data files are not
+        saved.
+
+        Args:
+            location: path of the snapshot file (.h5), an existing file is replaced.
+            compression: (optional) h5py compression (e.g. "gzip"), compressed
+                snapshots are smaller, but are read instead of memory mapped on load.
+        """
+        save_snapshot(self, location, compression=compression)
+
+    def load_snapshot(self, location):
+        """Add all data of a snapshot saved with save_snapshot, arrays are
+        memory mapped from the snapshot file (read-only) instead of being read.
+
+        Args:
+            location: path of the snapshot file.
+
+        Returns:
+            self
+        """
+        return load_snapshot(self, location)
+
+    def get_imported_data(self, dir_key, data_key):
+        """returns PsData stored under dir_key and data_key, or None if it has
+        not been imported"""
+        _, _, data_dir = self._process_dir_data_keys(dir_key, data_key)
+        return super().get(data_dir)
+
+    def _parallel_import(self, get_data_kwargs, num_workers, parallel_mode):
+        """import all files using a pool of workers and merge the results
+        in file order"""
+        num_workers = min(num_workers, len(self.PsDataImportInstances))
+        _logger.info(
+            "Importing {} files using {} {} workers".format(
+                len(self.PsDataImportInstances), num_workers, parallel_mode
+            )
+        )
+        if parallel_mode == "thread":
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                futures = [
+                    pool.submit(_import_instance_data, instance, get_data_kwargs)
+                    for instance in self.PsDataImportInstances
+                ]
+                results = [future.result() for future in futures]
+        elif parallel_mode == "process":
+            if self._import_options["lazy_load"]:
+                _logger.info("Lazy loading is not supported in process mode")
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                futures = [
+                    pool.submit(
+                        _import_detached_instance_data, instance, get_data_kwargs
+                    )
+                    for instance in self.PsDataImportInstances
+                ]
+                results = [future.result() for future in futures]
+        else:
+            raise ValueError(
+                "parallel_mode {} not supported, use 'thread' or 'process'".format(
+                    parallel_mode
+                )
+            )
+        for entries in results:
+            for dir_key, data_key, data in entries:
+                self.add_data(dir_key, data_key, data)
+
     def register_data_key(
         self,
         file_key,
@@ -138,6 +451,9 @@ class PsDataManager(dict):
         conversion_factor=None,
         directory=None,
         search_directories=None,
+        rows=None,
+        feasible_only=False,
+        storage_dtype=None,
     ):
         """register a key to be imported on next load_data call
         file_key: key in h5 file
@@ -150,6 +466,12 @@ class PsDataManager(dict):
                         e.g. if directory is dir_1 in file, and directory specified as cdir_1 the data will be stored
                         in (dir_1, cdir_1, return_key) instead of (dir_1, return_key)
         search_directories: (optional) - list of directories to limit search to
+        rows: (optional) - rows to import, a slice (e.g. slice(None, None, 10) for every 10th sample),
+                        boolean mask or list of row indexes, only these rows are read from h5 files
+        feasible_only: (optional) - if True, only feasible rows (solve_successful) are imported, the file row
+                        of every imported row is stored in PsData.row_indexes
+        storage_dtype: (optional) - dtype float data of this key is stored as, e.g. "float32", or "float16"
+                        for data that is only plotted, overrides the manager storage_dtype
         """
         if self.registered_key_list is None:
             self.registered_key_list = []
@@ -164,6 +486,12 @@ class PsDataManager(dict):
             key_dict["assign_units"] = assign_units
         if conversion_factor is not None:
             key_dict["conversion_factor"] = conversion_factor
+        if rows is not None:
+            key_dict["rows"] = rows
+        if feasible_only:
+            key_dict["feasible_only"] = True
+        if storage_dtype is not None:
+            key_dict["storage_dtype"] = storage_dtype
         if search_directories is not None:
             if isinstance(search_directories, str):
                 search_directories = [search_directories]
@@ -301,6 +629,8 @@ class PsDataManager(dict):
             __value.data_directory = __dir_key
         __value.__key = __key
         __value.__dir_key = __dir_key
+        if self.shared_arrays is not None:
+            self.shared_arrays.share_data(__value)
         self._mark_key_imported(__key)
         return super().__setitem__(__data_dir, __value)
 
@@ -362,7 +692,9 @@ class PsDataManager(dict):
 
     def __getitem__(self, __data_dir):
         data = super().__getitem__(__data_dir)
-        if self.mask_data and self.reduced_data_idx not in str(__data_dir):
+        if self.mask_data and self.reduced_data_idx not in self._key_table.to_str(
+            __data_dir
+        ):
             data = self._check_reduced(self._get_data_dir(__data_dir), data)
         return data
 
@@ -423,15 +755,19 @@ class PsDataManager(dict):
                 return True
             return False
 
+        if not exact:
+            selected_strs = [str(key) for key in selected_keys]
         for dkey in current_keys:
             num_keys_found = 0
-            for key in selected_keys:
+            if not exact:
+                dkey_str = self._key_table.to_str(dkey)
+            for i, key in enumerate(selected_keys):
                 if exact:
                     result = _key_dive(dkey, key)
                     if result:
                         num_keys_found += 1
                 else:
-                    if str(key) in str(dkey):
+                    if selected_strs[i] in dkey_str:
                         num_keys_found += 1
             if len(selected_keys) == num_keys_found and require_all_in_dir:
                 dir_keys.append(dkey)
@@ -734,9 +1070,15 @@ class PsDataManager(dict):
             if (
                 new_directory not in working_directory
                 and data_key == self._get_data_key(working_directory)
-                and all(dkey in str(working_directory) for dkey in stack_keys)
+                and all(
+                    dkey in self._key_table.to_str(working_directory)
+                    for dkey in stack_keys
+                )
             ):
-                all_keys = all(dkey in str(working_directory) for dkey in stack_keys)
+                all_keys = all(
+                    dkey in self._key_table.to_str(working_directory)
+                    for dkey in stack_keys
+                )
                 if all_keys:
                     dir_to_stack.append(working_directory)
                     keys_to_process.remove(working_directory)
@@ -797,8 +1139,10 @@ class PsDataManager(dict):
                 temp_map_data = []
                 map_units = []
                 temp_map_idxs = []
+                stacked_data = []
                 for i in stack_idxs:
                     data = self[tuple(dirs[i])]
+                    stacked_data.append(data)
                     temp_map_data.append(data.data)
                     data_shape = data.data.shape
 
@@ -864,6 +1208,8 @@ class PsDataManager(dict):
                         map_data,
                         units,
                         data_label=data.data_label,
+                        copy=False,
+                        storage_dtype=get_storage_dtype(*stacked_data),
                     )
                     idx_data = PsData(
                         stack_keys, "stacked_data_idxs", map_idxs, "dimensionless"
@@ -932,7 +1278,7 @@ class PsDataManager(dict):
             stack_directory = self.reduced_data
         current_keys = self.data_keys[:]
         for data_key in current_keys:
-            if str(stack_directory) not in str(data_key):
+            if str(stack_directory) not in self._key_table.to_str(data_key):
                 _, keys_to_process = self.generate_data_stack(
                     stack_keys,
                     data_key,
@@ -1011,9 +1357,8 @@ class PsDataManager(dict):
                 )
             )
             for idx, instance in enumerate(self.PsDataImportInstances):
-                available_keys = instance.unique_data_keys
-                nearest = difflib.get_close_matches(
-                    file_key, available_keys, n=10, cutoff=0.3
+                nearest = instance.key_search_index.get_close_matches(
+                    file_key, n=10, cutoff=0.3
                 )
                 if nearest:
                     _logger.warning(
@@ -1251,6 +1596,10 @@ class PsDataManager(dict):
                     ),
                     assign_units=_effective_assign,
                     units=_effective_units,
+                    copy=False,
+                    storage_dtype=get_storage_dtype(
+                        *[v for v in data_dict.values() if v.data_type != "zero_fill"]
+                    ),
                 )
                 result.data_key = return_key
                 result.data_label = return_key
@@ -178,6 +178,9 @@ class ExpressionNode:
         # --- leaf: data-key reference ---
         if self.key is not None:
             value = data_dict[self.key].data_with_units
+            if getattr(value, "dtype", None) == np.float16:
+                # float16 storage is computed in float32
+                value = value.astype(np.float32)
             if (
                 isinstance(value, qs.Quantity)
                 and value.dimensionality == qs.dimensionless.dimensionality
@@ -0,0 +1,95 @@
+"""Trigram index for fast near-match searches over data keys.
+
+``difflib.get_close_matches`` compares the searched key against every
+available key, which gets slow for files with tens of thousands of keys.
+:class:`FuzzyKeyIndex` builds a trigram inverted index once, uses it to
+shortlist keys that share the most trigrams with the searched key, and
+only ranks that shortlist with ``difflib``.
+
+Example::
+
+    index = FuzzyKeyIndex(["fs.costing.LCOW", "fs.water_recovery"])
+    index.get_close_matches("fs.costing.LCOE", n=1, cutoff=0.6)
+"""
+
+import difflib
+from collections import defaultdict, Counter
+
+__author__ = "Alexander V. Dudchenko "
+
+
+def _get_trigrams(key):
+    """Return the set of trigrams of *key*, padded so that short keys and
+    key starts/ends produce trigrams as well."""
+    padded = "  {} ".format(key)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyKeyIndex:
+    """Inverted trigram index over a collection of string keys.
+
+    Args:
+        keys: iterable of string keys to index, duplicates are ignored.
+        shortlist_size: number of keys sharing the most trigrams with the
+            searched key that are ranked with ``difflib``.
+    """
+
+    def __init__(self, keys, shortlist_size=100):
+        self.shortlist_size = shortlist_size
+        self.keys = []
+        self._key_ids = {}
+        self._postings = defaultdict(list)
+        self.add_keys(keys)
+
+    def add_keys(self, keys):
+        for key in keys:
+            if not isinstance(key, str) or key in self._key_ids:
+                continue
+            key_id = len(self.keys)
+            self.keys.append(key)
+            self._key_ids[key] = key_id
+            for trigram in _get_trigrams(key):
+                self._postings[trigram].append(key_id)
+
+    def __contains__(self, key):
+        return key in self._key_ids
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_candidates(self, key, restrict_to=None):
+        """Return indexed keys sharing at least one trigram with *key*,
+        ordered by number of shared trigrams.
+
+        Args:
+            key: key to search for.
+            restrict_to: (optional) container of keys, only keys in it are
+                returned.
+        """
+        counts = Counter()
+        for trigram in _get_trigrams(key):
+            postings = self._postings.get(trigram)
+            if postings:
+                counts.update(postings)
+        candidates = []
+        for key_id, _ in counts.most_common():
+            candidate = self.keys[key_id]
+            if restrict_to is None or candidate in restrict_to:
+                candidates.append(candidate)
+                if len(candidates) == self.shortlist_size:
+                    break
+        return candidates
+
+    def get_close_matches(self, key, n=3, cutoff=0.6, restrict_to=None):
+        """Drop-in replacement for ``difflib.get_close_matches`` over the
+        indexed keys.
+
+        Args:
+            key: key to search for.
+            n: maximum number of matches to return.
+            cutoff: minimum ``difflib`` similarity ratio (0-1).
+            restrict_to: (optional) container of keys, only keys in it are
+                considered.
+        """
+        shortlist = self.get_candidates(key, restrict_to=restrict_to)
+        return difflib.get_close_matches(key, shortlist, n=n, cutoff=cutoff)
@@ -0,0 +1,52 @@
+"""Cached string forms of PsDataManager keys.
+
+PsDataManager keys are nested tuples such as
+``(("sweep", 1.0), ("stage", 2), "LCOW")``. Selecting, masking and stacking
+data calls ``str(key)`` for substring matching again and again.
+:class:`KeyTable` caches the string form of every key on first use. Keys are
+stored as given, so adding data and plain lookups cost the same as with a
+plain dict.
+
+Example::
+
+    table = KeyTable()
+    "LCOW" in table.to_str((("sweep", 1.0), "LCOW"))
+"""
+
+__author__ = "Alexander V. Dudchenko "
+
+
+class KeyTable:
+    """Cache of the string forms of keys."""
+
+    def __init__(self):
+        self._strings = {}
+
+    def to_str(self, key):
+        """Return the cached string form of a key, unhashable keys are not
+        cached."""
+        if isinstance(key, str):
+            return key
+        try:
+            string = self._strings.get(key)
+        except TypeError:
+            return str(key)
+        if string is None:
+            string = self._strings[key] = str(key)
+        return string
+
+    def __contains__(self, key):
+        try:
+            return key in self._strings
+        except TypeError:
+            return False
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __getstate__(self):
+        # rebuilt on first use in the receiving process
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
@@ -0,0 +1,249 @@
+"""Snapshots of loaded PsDataManager data.
+
+A snapshot stores every :class:`PsData` of a :class:`PsDataManager` (arrays,
+units, labels, keys and feasibility masks) in a single h5 file with a fixed
+layout, so processed data (stacked data, expression results, costing) can be
+reopened without importing the raw files again::
+
+    /masks/<n>                 feasibility masks, shared between entries
+    /entries/<n>/<array>       PsData arrays (data, raw_data, ...)
+    /entries/<n>.attrs         manager key, PsData attributes and array units
+
+Arrays are stored uncompressed and contiguous, so on load they are memory
+mapped from the snapshot file instead of being read. Identical arrays of an
+entry are stored once.
+
+Example::
+
+    data_manager.save_snapshot("campaign.snapshot.h5")
+    data_manager = PsDataManager().load_snapshot("campaign.snapshot.h5")
+"""
+
+import ast
+import mmap
+
+import h5py
+import numpy as np
+import quantities as qs
+
+from psPlotKit.util import logger
+from psPlotKit.data_manager.ps_data import PsData, get_default_units
+
+__author__ = "Alexander V. Dudchenko "
+
+_logger = logger.define_logger(__name__, "PsSnapshot", level="INFO")
+
+SNAPSHOT_FORMAT = "psPlotKit snapshot"
+SNAPSHOT_VERSION = 1
+
+# array attributes of PsData, unit arrays are stored as their magnitude
+_ARRAY_ATTRIBUTES = ("_original_data", "_raw_data", "raw_data", "data")
+_UNIT_ATTRIBUTES = ("raw_data_with_units", "data_with_units")
+# attributes that are rebuilt on load
+_SKIPPED_ATTRIBUTES = frozenset(["_units", "_lazy_source", "_lazy_modified"])
+_MANAGER_KEY = "_PsDataManager__key"
+_MANAGER_DIR_KEY = "_PsDataManager__dir_key"
+
+
+def _to_literal(value):
+    """converts numpy scalars in (nested) keys to python values"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return tuple(_to_literal(v) for v in value)
+    if isinstance(value, list):
+        return [_to_literal(v) for v in value]
+    if isinstance(value, dict):
+        return {_to_literal(k): _to_literal(v) for k, v in value.items()}
+    return value
+
+
+def _encode(value):
+    """returns python literal of value, or None if it can not be restored"""
+    literal = repr(_to_literal(value))
+    try:
+        if ast.literal_eval(literal) != value:
+            return None
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+    return literal
+
+
+def _decode(literal):
+    return ast.literal_eval(literal)
+
+
+def _write_array(group, name, array, compression):
+    """writes array to group, str arrays are stored as utf-8 and object
+    arrays as float or str"""
+    array = np.asarray(array)
+    if array.dtype.hasobject:
+        try:
+            array = array.astype(float)
+        except (TypeError, ValueError):
+            array = array.astype(str)
+    if array.dtype.kind == "U":
+        dataset = group.create_dataset(name, data=np.char.encode(array, "utf-8"))
+        dataset.attrs["str"] = True
+        return dataset
+    if compression is not None and array.size > 0:
+        return group.create_dataset(
+            name, data=array, compression=compression, chunks=True
+        )
+    return group.create_dataset(name, data=array)
+
+
+def _find_equal(stored, array):
+    """returns name of an already stored array equal to array"""
+    if not isinstance(array, np.ndarray):
+        return None
+    for name, other in stored:
+        if other is array or (
+            other.shape == array.shape
+            and other.dtype == array.dtype
+            and np.array_equal(other, array, equal_nan=array.dtype.kind in "fc")
+        ):
+            return name
+    return None
+
+
+def save_snapshot(data_manager, location, compression=None):
+    """Write all data of a PsDataManager to a snapshot file.
+
+    Args:
+        data_manager: PsDataManager to save, lazily imported data is read.
+        location: path of the snapshot file, an existing file is replaced.
+        compression: (optional) h5py compression (e.g. "gzip"), compressed
+            arrays are smaller, but are read on load instead of being memory
+            mapped.
+    """
+    masks = {}
+    with h5py.File(location, "w") as f:
+        f.attrs["format"] = SNAPSHOT_FORMAT
+        f.attrs["version"] = SNAPSHOT_VERSION
+        mask_group = f.create_group("masks")
+        entries = f.create_group("entries")
+        for i, (key, data) in enumerate(dict.items(data_manager)):
+            entry = entries.create_group(str(i))
+            literal = _encode(key)
+            if literal is None:
+                raise ValueError("Key {} can not be saved in a snapshot".format(key))
+            entry.attrs["key"] = literal
+            if not data.is_loaded:
+                data._load_lazy_data()
+            attributes = data._get_attributes()
+            stored = []
+            for attr in _ARRAY_ATTRIBUTES + _UNIT_ATTRIBUTES:
+                if attr not in attributes:
+                    continue
+                array = attributes[attr]
+                if isinstance(array, qs.Quantity):
+                    entry.attrs[attr + "_units"] = str(array.dimensionality)
+                    array = array.magnitude
+                name = _find_equal(stored, array)
+                if name is not None:
+                    entry[attr] = entry[name]
+                else:
+                    _write_array(entry, attr, array, compression)
+                    stored.append((attr, np.asarray(array)))
+            feasible_indexes = attributes.get("feasible_indexes")
+            if isinstance(feasible_indexes, np.ndarray):
+                if id(feasible_indexes) not in masks:
+                    name = str(len(masks))
+                    _write_array(mask_group, name, feasible_indexes, compression)
+                    masks[id(feasible_indexes)] = (name, feasible_indexes)
+                entry["feasible_indexes"] = mask_group[masks[id(feasible_indexes)][0]]
+            for attr, value in attributes.items():
+                if (
+                    attr in _SKIPPED_ATTRIBUTES
+                    or attr in _ARRAY_ATTRIBUTES
+                    or attr in _UNIT_ATTRIBUTES
+                    or (attr == "feasible_indexes" and isinstance(value, np.ndarray))
+                ):
+                    continue
+                if isinstance(value, np.ndarray):
+                    _write_array(entry, attr, value, compression)
+                    continue
+                literal = _encode(value)
+                if literal is None:
+                    _logger.debug(
+                        "Attribute {} of {} is not saved".format(attr, data.data_key)
+                    )
+                else:
+                    entry.attrs["attr:" + attr] = literal
+    _logger.info(
+        "Saved {} data sets to snapshot {}".format(len(data_manager), location)
+    )
+
+
+class _SnapshotReader:
+    """maps arrays of a snapshot file, uncompressed arrays are views into one
+    memory map of the file"""
+
+    def __init__(self, location):
+        with open(location, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.arrays = {}
+
+    def read(self, dataset):
+        if dataset.attrs.get("str", False):
+            return np.char.decode(dataset[()], "utf-8")
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.size == 0:
+            return dataset[()]
+        if offset not in self.arrays:
+            array = np.ndarray(
+                dataset.shape, dtype=dataset.dtype, buffer=self.buffer, offset=offset
+            )
+            self.arrays[offset] = array
+        return self.arrays[offset]
+
+
+def load_snapshot(data_manager, location):
+    """Add all data of a snapshot file to a PsDataManager.
+
+    Args:
+        data_manager: PsDataManager to add data to.
+        location: path of a snapshot written by :func:`save_snapshot`.
+
+    Returns:
+        data_manager
+    """
+    reader = _SnapshotReader(location)
+    custom_units = get_default_units()
+    with h5py.File(location, "r") as f:
+        if f.attrs.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError("{} is not a psPlotKit snapshot".format(location))
+        if f.attrs["version"] > SNAPSHOT_VERSION:
+            raise ValueError(
+                "Snapshot {} was written by a newer version (format version {})".format(
+                    location, f.attrs["version"]
+                )
+            )
+        entries = f["entries"]
+        num_entries = len(entries)
+        for i in range(num_entries):
+            entry = entries[str(i)]
+            data = PsData.__new__(PsData)
+            state = {}
+            for attr, literal in entry.attrs.items():
+                if attr.startswith("attr:"):
+                    state[attr[5:]] = _decode(literal)
+            for name in entry:
+                array = reader.read(entry[name])
+                if name + "_units" in entry.attrs:
+                    array = qs.Quantity(array, entry.attrs[name + "_units"])
+                state[name] = array
+            state["_units"] = custom_units
+            state["_lazy_source"] = None
+            state["_lazy_modified"] = False
+            data.__setstate__(state)
+            key = _decode(entry.attrs["key"])
+            if _MANAGER_KEY in state and _MANAGER_DIR_KEY in state:
+                data_manager.add_data(
+                    state[_MANAGER_DIR_KEY], state[_MANAGER_KEY], data
+                )
+            else:
+                data_manager[key] = data
+    _logger.info("Loaded {} data sets from snapshot {}".format(num_entries, location))
+    return data_manager
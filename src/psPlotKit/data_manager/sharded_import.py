@@ -0,0 +1,283 @@
+"""Import of result sets that are split over many files.
+
+MPI parallel sweeps write one file per rank. :class:`ShardedDataImport`
+treats such shard files as one data source: every shard is indexed and read
+with its own :class:`PsDataImport` (in parallel), directories are labeled
+over all shards, and data found under the same directory and key is
+concatenated along the sweep sample axis in shard order.
+
+Example::
+
+    shards = ShardedDataImport("sweep_results_rank_*.h5")
+    shards.get_data(["fs.costing.LCOW"], PsDataManager=data_manager)
+"""
+
+import glob
+import pickle
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from psPlotKit.util import logger
+from psPlotKit.data_manager.data_importer import PsDataImport
+from psPlotKit.data_manager.ps_key_index import FuzzyKeyIndex
+
+__author__ = "Alexander V. Dudchenko "
+
+_logger = logger.define_logger(__name__, "ShardedDataImport", level="INFO")
+
+
+def _natural_sort_key(file_location):
+    """sort key that orders rank_2 before rank_10"""
+    return [
+        int(part) if part.isdigit() else part
+        for part in re.split(r"(\d+)", file_location)
+    ]
+
+
+def _hashable_directory(return_dir):
+    if isinstance(return_dir, list):
+        return tuple(return_dir)
+    return return_dir
+
+
+class _ShardCollector:
+    """Stand-in for PsDataManager passed to the get_data of each shard"""
+
+    def __init__(self):
+        self.entries = []
+
+    def add_data(self, dir_key, data_key, data):
+        self.entries.append((dir_key, data_key, data))
+
+
+class ShardedDataImport:
+    """One logical data source made of many shard files.
+
+    Args:
+        shard_files: glob pattern or list of shard file paths (.h5 or .json).
+        group_keys: keys that identify a terminal data directory.
+        data_keys: keys under which data values are stored.
+        default_return_directory: (optional) directory label added to all
+            imported data.
+        sort_key: (optional) callable returning the sort key of a shard path,
+            shards are concatenated in this order. Files matched by a glob
+            pattern are sorted by name with numbers compared by value
+            (rank_2 before rank_10), an explicit list is kept in order.
+        num_workers: (optional) number of threads used to index and read
+            shards, defaults to the ThreadPoolExecutor default.
+        **import_options: options passed to each :class:`PsDataImport`.
+    """
+
+    def __init__(
+        self,
+        shard_files,
+        group_keys=["outputs"],
+        data_keys=["values", "value"],
+        default_return_directory=None,
+        sort_key=None,
+        num_workers=None,
+        **import_options,
+    ):
+        self.shard_pattern = shard_files if isinstance(shard_files, str) else None
+        self.sort_key = sort_key
+        self.group_keys = group_keys
+        self.data_keys = data_keys
+        self.default_return_directory = default_return_directory
+        self.num_workers = num_workers
+        if import_options.get("lazy_load"):
+            _logger.info("Lazy loading is not supported for sharded files")
+            import_options["lazy_load"] = False
+            import_options["memory_budget"] = None
+        self.import_options = import_options
+        self.chunk_cache = import_options.get("chunk_cache")
+        self.data_location = self._find_shard_files(shard_files)
+        _logger.info("Importing {} shard files".format(len(self.data_location)))
+        self.shards = self._map_shards(self._create_shard, self.data_location)
+        self._update_index()
+
+    def _find_shard_files(self, shard_files):
+        if isinstance(shard_files, str):
+            found_files = sorted(
+                glob.glob(shard_files), key=self.sort_key or _natural_sort_key
+            )
+        else:
+            found_files = list(shard_files)
+            if self.sort_key is not None:
+                found_files.sort(key=self.sort_key)
+        if not found_files:
+            raise FileNotFoundError("No shard files found for {}".format(shard_files))
+        return found_files
+
+    def _create_shard(self, file_location):
+        return PsDataImport(
+            file_location,
+            self.group_keys,
+            self.data_keys,
+            default_return_directory=self.default_return_directory,
+            **self.import_options,
+        )
+
+    def _map_shards(self, func, items, num_workers=None):
+        """applies func to items in a thread pool, results are in item order"""
+        if num_workers is None:
+            num_workers = self.num_workers
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            return list(pool.map(func, items))
+
+    def _update_index(self):
+        """merges shard indexes and labels directories over all shards, so a
+        directory gets the same return directory in every shard"""
+        self.directories = []
+        found_directories = set()
+        unique_data_keys = set()
+        for shard in self.shards:
+            unique_data_keys.update(shard.unique_data_keys)
+            for d in shard.directories:
+                if d not in found_directories:
+                    found_directories.add(d)
+                    self.directories.append(d)
+        self.unique_data_keys = sorted(unique_data_keys)
+        self._key_search_index = None
+        labels = PsDataImport.__new__(PsDataImport)
+        labels.directories = list(self.directories)
+        labels.file_index = {d: {} for d in self.directories}
+        labels.directory_indexes = {}
+        labels.get_unique_directories()
+        self.directories = labels.directories
+        self.global_unique_directories = labels.global_unique_directories
+        for shard in self.shards:
+            shard.directories = [d for d in shard.directories if d in labels.file_index]
+            for d in list(shard.file_index):
+                if d in labels.file_index:
+                    shard.file_index[d]["unique_directory"] = labels.file_index[d][
+                        "unique_directory"
+                    ]
+                else:
+                    del shard.file_index[d]
+            shard.directory_indexes = {
+                label: [d for d in label_directories if d in shard.file_index]
+                for label, label_directories in labels.directory_indexes.items()
+            }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_key_search_index"] = None
+        try:
+            pickle.dumps(self.sort_key)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            # e.g. a lambda, shards are already ordered, new shards found by
+            # refresh of the unpickled import are sorted by name
+            state["sort_key"] = None
+        return state
+
+    @property
+    def key_search_index(self):
+        """trigram index over unique data keys of all shards"""
+        if self._key_search_index is None:
+            self._key_search_index = FuzzyKeyIndex(self.unique_data_keys)
+        return self._key_search_index
+
+    def refresh(self):
+        """picks up new shard files matching the glob pattern and re-scans
+        existing shards, returns list of new directories. Sharded data is
+        imported again in full by get_data(refresh=True)."""
+        known_directories = set(self.directories)
+        self._map_shards(PsDataImport.refresh, self.shards)
+        if self.shard_pattern is not None:
+            shard_files = self._find_shard_files(self.shard_pattern)
+            known_files = set(self.data_location)
+            new_files = [f for f in shard_files if f not in known_files]
+            if new_files:
+                _logger.info("Found {} new shard files".format(len(new_files)))
+                shards = dict(zip(self.data_location, self.shards))
+                shards.update(
+                    zip(new_files, self._map_shards(self._create_shard, new_files))
+                )
+                self.data_location = shard_files
+                self.shards = [shards[f] for f in shard_files]
+        self._update_index()
+        return [d for d in self.directories if d not in known_directories]
+
+    def get_data(
+        self,
+        data_key_list=None,
+        directories=None,
+        num_keys=None,
+        exact_keys=False,
+        match_accuracy=None,
+        PsDataManager=None,
+        num_workers=None,
+        refresh=False,
+        rows=None,
+        feasible_only=False,
+    ):
+        """reads data from all shards in parallel and concatenates data found
+        under the same directory and key in shard order, takes the same
+        arguments as PsDataImport.get_data, num_workers sets the number of
+        shards read in parallel and rows are selected in each shard. Rows
+        appended to shards can not be appended to concatenated data, so
+        refresh re-imports all data."""
+        if data_key_list is None:
+            data_key_list = self.unique_data_keys
+            exact_keys = True
+
+        def get_shard_data(shard):
+            collector = _ShardCollector()
+            shard.get_data(
+                data_key_list=data_key_list,
+                directories=directories,
+                num_keys=num_keys,
+                exact_keys=exact_keys,
+                match_accuracy=match_accuracy,
+                PsDataManager=collector,
+                rows=rows,
+                feasible_only=feasible_only,
+            )
+            return collector.entries
+
+        shard_entries = self._map_shards(get_shard_data, self.shards, num_workers)
+        merged = {}
+        for entries in shard_entries:
+            for return_dir, return_key, data in entries:
+                key = (_hashable_directory(return_dir), return_key)
+                if key not in merged:
+                    merged[key] = (return_dir, return_key, [])
+                merged[key][2].append(data)
+        if PsDataManager is None:
+            data_dict = {}
+        for return_dir, return_key, parts in merged.values():
+            data = self._concatenate(parts)
+            if PsDataManager is not None:
+                PsDataManager.add_data(return_dir, return_key, data)
+            else:
+                data_dict[_hashable_directory(return_dir), return_key] = data
+        if PsDataManager is not None:
+            return PsDataManager
+        return data_dict
+
+    def _concatenate(self, parts):
+        """concatenates shard PsData along the sweep sample axis into the
+        first part"""
+        merged = parts[0]
+        if len(parts) == 1:
+            return merged
+        masks = [part.feasible_indexes for part in parts]
+        merged.extend_data(np.concatenate([part._original_data for part in parts[1:]]))
+        # row indexes of each shard refer to rows of that shard only
+        merged.row_indexes = None
+        if all(isinstance(mask, np.ndarray) for mask in masks):
+            merged.feasible_indexes = np.concatenate(masks)
+        else:
+            merged.feasible_indexes = None
+        return merged
+
+    def display_loaded_contents(self):
+        _logger.info("---Displaying loaded shard files---")
+        for file_location in self.data_location:
+            _logger.info("Shard: {}".format(file_location))
+        for d in self.directories:
+            _logger.info("Directory: {}".format(d))
+        for key in self.unique_data_keys:
+            _logger.info("Data key: {}".format(key))
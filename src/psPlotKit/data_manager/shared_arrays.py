@@ -0,0 +1,266 @@
+"""Shared memory backing for PsData arrays.
+
+Worker processes that receive a pickled :class:`PsDataManager` normally get
+their own copy of every array. :class:`SharedArrayStore` moves PsData arrays
+into ``multiprocessing.shared_memory`` blocks instead. Pickled PsData then only
+carry a reference to their block, and workers attach to the block and get
+zero-copy, read-only views of the arrays.
+
+Arrays are packed into large arena blocks, so sharing many small arrays only
+creates a few blocks (and memory maps). Blocks mapped in a process are kept
+sorted by address, so the block of an array is found by bisection.
+
+Example::
+
+    dm = PsDataManager("sweep.h5", shared_memory=True)
+    dm.load_data()
+    with ProcessPoolExecutor() as pool:
+        results = list(pool.map(plot_directory, [dm] * 4, directories))
+    dm.free_shared_memory()
+"""
+
+import bisect
+import ctypes
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import quantities as qs
+
+from psPlotKit.util import logger
+
+__author__ = "Alexander V. Dudchenko "
+
+_logger = logger.define_logger(__name__, "SharedArrayStore", level="INFO")
+
+# default size of the blocks arrays are packed into, larger arrays get a block
+# of their own
+ARENA_SIZE = 64 * 1024**2
+# byte alignment of arrays in a block
+_ALIGNMENT = 64
+
+# blocks mapped in this process, name -> weak reference to the block array,
+# and start addresses (sorted) with the (end address, name) of each block
+_blocks = {}
+_block_starts = []
+_block_ends = []
+_blocks_lock = threading.RLock()
+
+
+class SharedArrayReference:
+    """Picklable reference to an array stored in a shared memory block.
+
+    Args:
+        name: name of the shared memory block.
+        offset: byte offset of the first element in the block.
+        shape: array shape.
+        strides: array strides.
+        dtype: array dtype.
+        units: (optional) dimensionality of a quantities array.
+    """
+
+    def __init__(self, name, offset, shape, strides, dtype, units=None):
+        self.name = name
+        self.offset = offset
+        self.shape = shape
+        self.strides = strides
+        self.dtype = dtype
+        self.units = units
+
+    def attach(self):
+        """Return a read-only view of the array, attaching to the block if it
+        is not open in this process yet."""
+        with _blocks_lock:
+            buffer = _blocks[self.name]() if self.name in _blocks else None
+            if buffer is None:
+                buffer = _map_block(shared_memory.SharedMemory(name=self.name))
+        array = np.ndarray(
+            self.shape,
+            dtype=self.dtype,
+            buffer=buffer,
+            offset=self.offset,
+            strides=self.strides,
+        )
+        array.flags.writeable = False
+        if self.units is not None:
+            return qs.Quantity(array, self.units)
+        return array
+
+
+def get_shared_reference(array):
+    """Return a :class:`SharedArrayReference` if *array* is stored in a shared
+    memory block open in this process, None otherwise."""
+    if not isinstance(array, np.ndarray) or array.size == 0 or not _block_starts:
+        return None
+    address = array.__array_interface__["data"][0]
+    extents = [(n - 1) * stride for n, stride in zip(array.shape, array.strides)]
+    start = address + sum(e for e in extents if e < 0)
+    end = address + sum(e for e in extents if e > 0) + array.itemsize
+    with _blocks_lock:
+        index = bisect.bisect_right(_block_starts, start) - 1
+        if index < 0:
+            return None
+        block_start = _block_starts[index]
+        block_end, name = _block_ends[index]
+    if end > block_end:
+        return None
+    units = None
+    if isinstance(array, qs.Quantity):
+        units = array.dimensionality
+    return SharedArrayReference(
+        name,
+        address - block_start,
+        array.shape,
+        array.strides,
+        array.dtype,
+        units,
+    )
+
+
+def _map_block(block):
+    """returns a uint8 array of the whole block and registers it for lookups,
+    arrays keep the block open, so it is only closed once the last array
+    using it is released"""
+    # raw memory without buffer exports, so the block can be closed on release
+    address = ctypes.addressof(ctypes.c_char.from_buffer(block.buf))
+    raw = (ctypes.c_char * block.size).from_address(address)
+    raw.block = block
+    buffer = np.frombuffer(raw, dtype=np.uint8)
+    with _blocks_lock:
+        _blocks[block.name] = weakref.ref(buffer)
+        index = bisect.bisect_right(_block_starts, address)
+        _block_starts.insert(index, address)
+        _block_ends.insert(index, (address + block.size, block.name))
+    weakref.finalize(raw, _unregister_block, block.name, address)
+    return buffer
+
+
+def _unregister_block(name, address):
+    """removes a block from the lookups of this process"""
+    with _blocks_lock:
+        _blocks.pop(name, None)
+        index = bisect.bisect_left(_block_starts, address)
+        if index < len(_block_starts) and _block_ends[index][1] == name:
+            del _block_starts[index]
+            del _block_ends[index]
+
+
+def _free_blocks(blocks):
+    """unlinks blocks, their memory is freed once all views are released"""
+    for block, address in blocks:
+        _unregister_block(block.name, address)
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+
+class SharedArrayStore:
+    """Creates and frees the shared memory blocks of PsData arrays.
+
+    Arrays are packed into blocks of *arena_size* bytes. Blocks are freed by
+    :meth:`free`, when the store is used as a context manager, or when the
+    store is garbage collected. Arrays that still use a freed block stay valid
+    in the owning process, but workers can no longer attach to it.
+
+    Args:
+        arena_size: (optional) size of the blocks arrays are packed into in
+            bytes, larger arrays get a block of their own.
+    """
+
+    def __init__(self, arena_size=ARENA_SIZE):
+        self.arena_size = arena_size
+        self._blocks = []
+        self._arena = None
+        self._arena_offset = 0
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self._finalizer = weakref.finalize(self, _free_blocks, self._blocks)
+
+    def _create_block(self, size):
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        buffer = _map_block(block)
+        self._blocks.append((block, buffer.ctypes.data))
+        return buffer
+
+    def _allocate(self, nbytes):
+        """returns block array and offset of nbytes of free memory"""
+        with self._lock:
+            self.nbytes += nbytes
+            if nbytes > self.arena_size:
+                return self._create_block(nbytes), 0
+            offset = -(-self._arena_offset // _ALIGNMENT) * _ALIGNMENT
+            if self._arena is None or offset + nbytes > self._arena.size:
+                self._arena = self._create_block(self.arena_size)
+                offset = 0
+            self._arena_offset = offset + nbytes
+            return self._arena, offset
+
+    def share(self, array):
+        """Copy *array* into a shared memory block and return a read-only
+        view of it."""
+        array = np.asarray(array)
+        buffer, offset = self._allocate(array.nbytes)
+        shared = np.ndarray(
+            array.shape, dtype=array.dtype, buffer=buffer, offset=offset
+        )
+        shared[...] = array
+        shared.flags.writeable = False
+        return shared
+
+    def _share_array(self, array):
+        if (
+            not isinstance(array, np.ndarray)
+            or array.dtype.hasobject
+            or array.size == 0
+            or get_shared_reference(array) is not None
+        ):
+            return array
+        if isinstance(array, qs.Quantity):
+            return qs.Quantity(self.share(array.magnitude), array.dimensionality)
+        return self.share(array)
+
+    def share_data(self, ps_data):
+        """Move the arrays of a loaded PsData into shared memory, arrays that
+        are views of the unit arrays stay views."""
+        if not ps_data.is_loaded:
+            return ps_data
+        ps_data._map_arrays(self._share_array)
+        return ps_data
+
+    def free(self):
+        """Unlink all blocks created by this store."""
+        with self._lock:
+            self.nbytes = 0
+            self._arena = None
+            self._arena_offset = 0
+            self._finalizer()
+            self._finalizer = weakref.finalize(self, _free_blocks, self._blocks)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.free()
+
+    def __reduce__(self):
+        # blocks are owned by the creating process, unpickled stores are empty
+        return (SharedArrayStore, (self.arena_size,))
+
+
+def is_same_view(array, quantity):
+    """True if array is the magnitude of quantity, sharing its buffer"""
+    if not isinstance(array, np.ndarray) or not isinstance(quantity, qs.Quantity):
+        return False
+    magnitude = quantity.magnitude
+    return (
+        array.__array_interface__["data"] == magnitude.__array_interface__["data"]
+        and array.shape == magnitude.shape
+        and array.strides == magnitude.strides
+        and array.dtype == magnitude.dtype
+    )
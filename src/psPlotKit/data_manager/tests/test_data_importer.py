@@ -1,5 +1,6 @@
 import pytest
 import os
+import shutil
 from psPlotKit.data_manager.data_importer import PsDataImport
 
 __author__ = "Alexander V. Dudchenko "
@@ -154,3 +155,126 @@ def test_data_importer(get_data):
 #     print(index_list, index_str)
 #     assert index_list == None
 #     assert index_str == None
+
+
+def test_index_cache(tmp_path, monkeypatch):
+    data_file = tmp_path / "multi_dir_test.h5"
+    shutil.copy(os.path.join(_this_file_path, "multi_dir_test.h5"), data_file)
+    first = PsDataImport(str(data_file), index_cache=True)
+    assert os.path.exists(str(data_file) + ".psindex")
+
+    def fail_scan(self):
+        raise AssertionError("file should not be scanned when index is cached")
+
+    with monkeypatch.context() as m:
+        m.setattr(PsDataImport, "get_file_directories", fail_scan)
+        cached = PsDataImport(str(data_file), index_cache=True)
+    assert cached.directories == first.directories
+    assert cached.file_index == first.file_index
+    assert cached.directory_indexes == first.directory_indexes
+    assert cached.unique_data_keys == first.unique_data_keys
+    assert cached.sub_contents == first.sub_contents
+
+    # changing the file invalidates the cache
+    os.utime(data_file, ns=(0, 0))
+    with monkeypatch.context() as m:
+        m.setattr(PsDataImport, "get_file_directories", fail_scan)
+        with pytest.raises(AssertionError):
+            PsDataImport(str(data_file), index_cache=True)
+
+
+def test_index_cache_folder(tmp_path):
+    cache_dir = tmp_path / "cache"
+    PsDataImport(
+        os.path.join(_this_file_path, "multi_dir_test.h5"), index_cache=str(cache_dir)
+    )
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_directory_key_map(get_data):
+    directory = "ro_analysis/erd_type/pressure_exchanger/membrane_group"
+    key_map = get_data.directory_key_map[directory]
+    assert set(key_map.keys()) == {"outputs", "solve_successful", "sweep_params"}
+    assert key_map["outputs"]["LCOW"] == (directory, "outputs", "LCOW")
+    for data_type, keys in key_map.items():
+        assert list(keys) == get_data.file_index[directory][data_type]["data_keys"]
+    assert get_data._get_nearest_key(directory, "LCOW", True) == (["LCOW"], "outputs")
+    assert get_data._get_nearest_key(directory, "missing", True) == (
+        None,
+        "sweep_params",
+    )
+
+
+def test_unique_directories_multi_dimensional_sweep():
+    importer = PsDataImport.__new__(PsDataImport)
+    importer.directories = [
+        "sweep/stages/{}/recovery/{}".format(s, r) for s in [1, 2] for r in [0.5, 0.7]
+    ]
+    importer.file_index = {d: {} for d in importer.directories}
+    importer.directory_indexes = {}
+    importer.get_unique_directories()
+    assert importer.file_index["sweep/stages/2/recovery/0.7"]["unique_directory"] == [
+        ("stages", 2),
+        ("recovery", 0.7),
+    ]
+    assert importer.directory_indexes[("stages", 1)] == [
+        "sweep/stages/1/recovery/0.5",
+        "sweep/stages/1/recovery/0.7",
+    ]
+
+
+def test_file_directories_follow_group_order(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    data_file = tmp_path / "track_order.h5"
+    with h5py.File(data_file, "w", track_order=True) as f:
+        for sweep in ["b_sweep", "a_sweep"]:
+            sweep_group = f.create_group("sweeps/" + sweep)
+            outputs = sweep_group.create_group("outputs")
+            outputs.create_group("fs.LCOW").create_dataset("value", data=[1.0])
+            sweep_group.create_dataset("note", data=0)
+    importer = PsDataImport(str(data_file), ["outputs"], ["value"])
+    assert importer.directories == ["sweeps/b_sweep", "sweeps/a_sweep"]
+    file_index = importer.file_index["sweeps/a_sweep"]
+    assert file_index["outputs"]["data_keys"] == ["fs.LCOW"]
+    assert file_index["_data"] == ["note"]
+    importer.data_file.close()
+
+
+def test_row_selection():
+    from psPlotKit.data_manager.data_importer import _get_row_selection
+
+    assert _get_row_selection(None, 10) == ()
+    assert _get_row_selection(slice(None, None, 3), 10) == slice(0, 10, 3)
+    assert _get_row_selection([4, 2, 3, 3], 10) == slice(2, 5)
+    assert list(_get_row_selection([-1, 0], 10)) == [0, 9]
+    mask = [True, False] * 5
+    assert list(_get_row_selection(mask, 10)) == [0, 2, 4, 6, 8]
+    with pytest.raises(ValueError):
+        _get_row_selection(mask, 12)
+
+
+def test_dense_rows_read_as_hyperslab(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    import numpy as np
+    from psPlotKit.data_manager.ps_data import read_rows
+
+    class _Recorder:
+        def __init__(self, dataset):
+            self.dataset = dataset
+            self.selections = []
+
+        def __getitem__(self, selection):
+            self.selections.append(selection)
+            return self.dataset[selection]
+
+    values = np.arange(10000.0)
+    with h5py.File(tmp_path / "rows.h5", "w") as f:
+        f["data"] = values
+        source = _Recorder(f["data"])
+        dense = np.flatnonzero(values % 2 == 0)[5:]
+        np.testing.assert_array_equal(read_rows(source, dense), values[dense])
+        assert source.selections == [slice(10, 9999)]
+        sparse = np.array([3, 5000, 9000])
+        np.testing.assert_array_equal(read_rows(source, sparse), values[sparse])
+        assert source.selections[-1] is sparse
+        assert read_rows(source, slice(2, 4)).tolist() == [2.0, 3.0]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from psPlotKit.data_manager.h5_handle_pool import H5HandlePool
+from psPlotKit.data_manager.ps_data_manager import PsDataManager
+
+__author__ = "Alexander V. Dudchenko "
+
+h5py = pytest.importorskip("h5py")
+
+
+def _write_files(tmp_path, num_files):
+    data_files = []
+    for i in range(num_files):
+        data_file = str(tmp_path / "sweep_{}.h5".format(i))
+        with h5py.File(data_file, "w") as f:
+            lcow = f.create_group("sweep/r_1/outputs/fs.costing.LCOW")
+            lcow.create_dataset("value", data=np.arange(4) + i)
+            lcow["units"] = b"USD/m**3"
+        data_files.append({"file": data_file, "return_directory": "file_{}".format(i)})
+    return data_files
+
+
+def _load(data_files, **kwargs):
+    dm = PsDataManager(data_files, **kwargs)
+    dm.register_data_key("fs.costing.LCOW", "LCOW")
+    dm.load_data()
+    return dm
+
+
+def test_pool_closes_least_recently_used(tmp_path):
+    data_files = [f["file"] for f in _write_files(tmp_path, 3)]
+    pool = H5HandlePool(max_open_files=2)
+    first = pool.get(data_files[0])
+    pool.get(data_files[1])
+    pool.get(data_files[0])
+    pool.get(data_files[2])
+    assert pool.open_files == [data_files[0], data_files[2]]
+    assert first.id.valid
+    with pool.use(data_files[0]):
+        pool.get(data_files[1])
+        pool.get(data_files[2])
+        # files in use are not closed
+        assert data_files[0] in pool.open_files
+    assert len(pool) == 2
+    pool.close_all()
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize("lazy_load", [False, True])
+def test_pooled_import_matches_open_files(tmp_path, lazy_load):
+    data_files = _write_files(tmp_path, 4)
+    expected = _load(data_files)
+    dm = _load(data_files, lazy_load=lazy_load, max_open_files=2)
+    pool = dm._import_options["handle_pool"]
+    assert len(pool) <= 2
+    assert list(dm.keys()) == list(expected.keys())
+    for key in expected.keys():
+        # lazy data of closed files is read after re-opening the file
+        np.testing.assert_array_equal(dm[key].data, expected[key].data)
+        assert dm[key].sunits == expected[key].sunits
+    assert len(pool) <= 2
+
+
+def test_chunk_cache_per_file(tmp_path):
+    data_files = _write_files(tmp_path, 2)
+    pool = H5HandlePool(max_open_files=1)
+    dm = PsDataManager(max_open_files=pool, chunk_cache={"rdcc_nbytes": 2 * 1024**2})
+    dm.register_data_file(data_files[0]["file"])
+    dm.register_data_file(
+        data_files[1]["file"], chunk_cache={"rdcc_nbytes": 8 * 1024**2}
+    )
+    dm.register_data_key("fs.costing.LCOW", "LCOW")
+    dm.load_data()
+    for data_file, nbytes in zip(data_files, [2 * 1024**2, 8 * 1024**2]):
+        cache = pool.get(data_file["file"]).id.get_access_plist().get_cache()
+        assert cache[2] == nbytes
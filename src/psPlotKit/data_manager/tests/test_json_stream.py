@@ -0,0 +1,100 @@
+import itertools
+import json
+import numpy as np
+import pytest
+from psPlotKit.data_manager.json_stream import JsonStreamFile, JsonValue
+from psPlotKit.data_manager.ps_data_manager import PsDataManager
+
+__author__ = "Alexander V. Dudchenko "
+
+
+def _write_sweep(tmp_path, indent=None):
+    doc = {"sweep": {}}
+    for i, name in enumerate(["recovery_0.5", "recovery_0.7"]):
+        doc["sweep"][name] = {
+            "outputs": {
+                "fs.costing.LCOW": {"value": [1.0 + i, 2.0, 3.5], "units": "USD/m**3"},
+                "fs.flow[1]": {"value": [1, 2, float("nan")], "units": "m**3/s"},
+            },
+            "solve_successful": {"solve_successful": [True, False, True]},
+        }
+    data_file = tmp_path / "sweep_{}.json".format(indent)
+    with open(data_file, "w") as f:
+        json.dump(doc, f, indent=indent)
+    return str(data_file)
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_structure_matches_json_load(tmp_path, indent):
+    data_file = _write_sweep(tmp_path, indent)
+    json_file = JsonStreamFile(data_file)
+    outputs = json_file.root["sweep"]["recovery_0.7"]["outputs"]
+    assert list(outputs.keys()) == ["fs.costing.LCOW", "fs.flow[1]"]
+    assert outputs["fs.costing.LCOW"]["units"] == "USD/m**3"
+    assert isinstance(outputs["fs.costing.LCOW"]["value"], JsonValue)
+    np.testing.assert_array_equal(
+        outputs["fs.costing.LCOW"]["value"][()], [2.0, 2.0, 3.5]
+    )
+    np.testing.assert_array_equal(outputs["fs.flow[1]"]["value"][()], [1, 2, np.nan])
+    json_file.close()
+
+
+def test_non_numeric_arrays(tmp_path):
+    data_file = tmp_path / "mixed.json"
+    with open(data_file, "w") as f:
+        json.dump({"a": ["x]", 'y"['], "b": [[1, 2], [3, 4]], "c": [], "d": 5}, f)
+    json_file = JsonStreamFile(str(data_file))
+    assert list(json_file.root["a"][()]) == ["x]", 'y"[']
+    assert np.shape(json_file.root["b"][()]) == (2, 2)
+    assert len(json_file.root["c"][()]) == 0
+    assert json_file.root["d"] == 5
+    json_file.close()
+
+
+def test_stream_import_matches_json_load(tmp_path):
+    data_file = _write_sweep(tmp_path)
+    managers = []
+    for stream_json in (False, True):
+        dm = PsDataManager(data_file, stream_json=stream_json)
+        dm.register_data_key("fs.costing.LCOW", "LCOW")
+        dm.register_data_key("fs.flow[1]", "flow")
+        dm.load_data()
+        managers.append(dm)
+    loaded, streamed = managers
+    assert list(streamed.keys()) == list(loaded.keys())
+    for key in loaded.keys():
+        np.testing.assert_array_equal(streamed[key].data, loaded[key].data)
+        assert streamed[key].sunits == loaded[key].sunits
+        np.testing.assert_array_equal(
+            streamed[key].feasible_indexes, [True, False, True]
+        )
+
+
+def test_null_and_string_arrays_match_json_load(tmp_path):
+    data_file = tmp_path / "null.json"
+    doc = {
+        "outputs": {
+            "fs.length": {"value": [1.0, None, 3.0], "units": "m"},
+            "fs.label": {"value": ["a", "b", "c"], "units": "None"},
+        },
+        "solve_successful": {"solve_successful": [True, True, True]},
+    }
+    with open(data_file, "w") as f:
+        json.dump(doc, f)
+    managers = []
+    for stream_json, rows in itertools.product((False, True), (None, [0, 1, 2])):
+        dm = PsDataManager(str(data_file), stream_json=stream_json)
+        dm.register_data_key("fs.length", "length", rows=rows)
+        dm.register_data_key("fs.label", "label", rows=rows)
+        dm.load_data()
+        managers.append(dm)
+    for dm in managers:
+        length = dm["length"]
+        assert length.data.dtype == float
+        np.testing.assert_array_equal(length.data, [1.0, np.nan, 3.0])
+        np.testing.assert_array_equal((length * 2).data, [2.0, np.nan, 6.0])
+        np.testing.assert_array_equal(
+            length.to_units("cm").data, [100.0, np.nan, 300.0]
+        )
+        assert not dm["label"].data_is_numbers
+        assert list(dm["label"].data) == ["a", "b", "c"]
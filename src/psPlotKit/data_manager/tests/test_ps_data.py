@@ -1,7 +1,11 @@
 import pytest
 import numpy as np
 import quantities as qs
-from psPlotKit.data_manager.ps_data import PsData
+import copy
+import pickle
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from psPlotKit.data_manager.ps_data import PsData, get_default_units
 
 __author__ = "Alexander V. Dudchenko "
 
@@ -435,3 +439,187 @@ class TestUnitErrors:
         assert "length" in msg
         assert "cost" in msg
         assert "test" in msg
+
+
+# ---------- copy-free construction ----------
+
+
+class TestSharedBuffer:
+    def test_arrays_share_one_buffer(self):
+        array = np.arange(5.0)
+        ps = PsData("x", "test", array, import_units="m")
+        # the input is copied once, then all arrays are views of that copy
+        assert not np.shares_memory(ps.data, array)
+        for other in (ps.raw_data, ps._raw_data, ps._original_data):
+            assert np.shares_memory(ps.data, other)
+        assert np.shares_memory(ps.data, ps.data_with_units)
+        assert np.shares_memory(ps.data, ps.raw_data_with_units)
+        assert ps.nbytes == array.nbytes
+        with pytest.raises(ValueError):
+            ps.data[0] = 1.0
+        assert array.flags.writeable
+
+    def test_copy_false_uses_input(self):
+        array = np.arange(5.0)
+        ps = PsData("x", "test", array, copy=False)
+        assert np.shares_memory(ps.data, array)
+
+    def test_conversions_create_new_arrays(self):
+        ps = PsData("x", "test", np.arange(5.0), import_units="m")
+        original = ps._original_data
+        ps.to_units("mm")
+        assert not np.shares_memory(ps.data, original)
+        np.testing.assert_array_equal(ps.data, np.arange(5.0) * 1000)
+        np.testing.assert_array_equal(ps._original_data, np.arange(5.0))
+        ps.feasible_indexes = np.array([True, False, True, False, True])
+        ps.mask_data(feasible_only=True)
+        np.testing.assert_array_equal(ps._raw_data, [0.0, 2.0, 4.0])
+        np.testing.assert_array_equal(ps._original_data, np.arange(5.0))
+
+
+# ---------- shared unit registry ----------
+
+
+class TestDefaultUnits:
+    def test_units_are_shared(self, usd_ps):
+        other = PsData("cost", "test", [1.0], import_units="USD")
+        assert usd_ps.custom_units is other.custom_units
+        assert usd_ps.custom_units["USD"] is get_default_units().USD
+        assert (usd_ps + other).custom_units is other.custom_units
+
+    def test_register_from_threads(self):
+        units = get_default_units()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            registered = list(
+                pool.map(
+                    lambda _: units.register("kEUR_test", 1000 * units.USD), range(32)
+                )
+            )
+        assert all(unit is registered[0] for unit in registered)
+        ps = PsData("cost", "test", [2.0], import_units="kEUR_test")
+        assert ps.to_units("USD").data[0] == pytest.approx(2000.0)
+
+    def test_pickled_data_uses_default_units(self, usd_ps):
+        unpickled = pickle.loads(pickle.dumps(usd_ps))
+        assert unpickled.custom_units is get_default_units().get_units_dict()
+        assert unpickled.to_units("kUSD").data[0] == pytest.approx(0.1)
+
+
+# ---------- cached unit conversions ----------
+
+
+class TestUnitConversionCache:
+    def test_conversion_is_cached(self):
+        units = get_default_units()
+        ps = PsData("flow", "test", [1.0, 2.0], import_units="gpm")
+        ps.to_units("L/s")
+        assert ps.sunits == "L/s"
+        assert units._conversion_cache[("US_liquid_gallon/min", "L/s")][0] == (
+            pytest.approx(0.0630901964)
+        )
+        np.testing.assert_allclose(ps.data, [0.0630901964, 0.1261803928])
+        expected = qs.Quantity([1.0, 2.0], "US_liquid_gallon/min").rescale("L/s")
+        np.testing.assert_allclose(ps.raw_data_with_units.magnitude, expected.magnitude)
+        assert str(ps.data_with_units.dimensionality) == "L/s"
+
+    def test_kelvin_to_degc_offsets_data(self):
+        ps = PsData("temperature", "test", [273.15, 300.0], import_units="K")
+        ps.to_units("degC")
+        np.testing.assert_allclose(ps.data, [0.0, 26.85])
+        np.testing.assert_allclose(ps.raw_data, [273.15, 300.0])
+
+    def test_failed_conversion_keeps_units(self, meter_ps):
+        with pytest.raises(ValueError):
+            meter_ps.to_units("kg")
+        assert meter_ps.sunits == "m"
+        assert meter_ps.to_units("cm").data[0] == pytest.approx(1000.0)
+
+
+# ---------- compact PsData ----------
+
+
+class TestCompactPsData:
+    def test_unit_arrays_are_built_on_access(self, meter_ps):
+        assert meter_ps._data_with_units is None
+        assert meter_ps.data_with_units is meter_ps.data_with_units
+        assert np.shares_memory(meter_ps.data_with_units, meter_ps.data)
+        assert meter_ps.mpl_units == "m"
+        assert not meter_ps.__dict__
+
+    def test_replaced_data_updates_unit_arrays(self, meter_ps):
+        meter_ps.set_data(np.array([5.0, 6.0]))
+        np.testing.assert_array_equal(meter_ps.data_with_units.magnitude, [5.0, 6.0])
+        np.testing.assert_array_equal(
+            meter_ps.raw_data_with_units.magnitude, [5.0, 6.0]
+        )
+        assert str(meter_ps.data_with_units.dimensionality) == "m"
+
+    def test_extra_attributes_and_copies(self, usd_ps):
+        usd_ps.filter_type = "1D"
+        copied = copy.deepcopy(usd_ps)
+        unpickled = pickle.loads(pickle.dumps(usd_ps))
+        for ps in (copied, unpickled):
+            assert ps.filter_type == "1D"
+            assert ps.sunits == "USD"
+            np.testing.assert_array_equal(ps.data, usd_ps.data)
+            assert ps.to_units("kUSD").data[0] == pytest.approx(0.1)
+
+
+class TestStorageDtype:
+    def test_float_data_is_cast(self):
+        d = PsData("x", "test", np.array([1.0, 2.0, 3.0]), storage_dtype=np.float32)
+        assert d.storage_dtype == "float32"
+        assert d.data.dtype == np.float32
+        assert d.raw_data.dtype == np.float32
+        assert d.data_with_units.dtype == np.float32
+
+    def test_non_float_data_is_not_cast(self):
+        d = PsData("x", "test", np.array([1, 2, 3]), storage_dtype="float16")
+        assert d.raw_data.dtype.kind == "i"
+        d = PsData("x", "test", np.array([True, False]), storage_dtype="float16")
+        assert d.raw_data.dtype == bool
+
+    def test_float16_is_computed_in_float32(self):
+        values = np.array([0.1, 0.2, 0.3])
+        d = PsData(
+            "x", "test", values, units="cm", assign_units="m", storage_dtype="float16"
+        )
+        # converted in float32 and stored as float16
+        assert d.data.dtype == np.float16
+        np.testing.assert_allclose(d.data, values * 100, rtol=1e-3)
+        result = d * d
+        assert result.storage_dtype == "float16"
+        assert result.data.dtype == np.float16
+        np.testing.assert_allclose(result.data, (values * 100) ** 2, rtol=1e-3)
+
+    def test_float16_overflow_is_stored_as_float32(self, caplog):
+        values = np.array([1.0, 1e6, np.nan])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            d = PsData("capex", "test", values, storage_dtype="float16")
+        assert "capex" in caplog.text
+        assert d.storage_dtype == "float32"
+        assert d.data.dtype == np.float32
+        np.testing.assert_array_equal(d.data, values)
+        # conversions that exceed float16 are kept as float32
+        d = PsData(
+            "x", "test", np.array([100.0]), "m", storage_dtype="float16"
+        ).to_units("mm")
+        assert d.data.dtype == np.float32
+        assert d.data[0] == 1e5
+
+    def test_arithmetic_uses_widest_dtype(self):
+        d32 = PsData("a", "test", np.array([1.0, 2.0]), storage_dtype="float32")
+        d16 = PsData("b", "test", np.array([1.0, 2.0]), storage_dtype="float16")
+        d64 = PsData("c", "test", np.array([1.0, 2.0]))
+        assert (d32 + d16).data.dtype == np.float32
+        assert (d16 * 2).data.dtype == np.float16
+        assert (-d16).data.dtype == np.float16
+        assert (d32 + d64).storage_dtype is None
+        assert (d32 + d64).data.dtype == np.float64
+
+    def test_pickle_keeps_storage_dtype(self):
+        d = PsData("x", "test", np.array([1.0, 2.0]), storage_dtype="float32")
+        unpickled = pickle.loads(pickle.dumps(d))
+        assert unpickled.storage_dtype == "float32"
+        assert unpickled.data.dtype == np.float32
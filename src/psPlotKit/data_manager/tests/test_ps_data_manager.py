@@ -1,5 +1,7 @@
+import gc
 import pytest
 import os
+import pickle
 import numpy as np
 from psPlotKit.data_manager.ps_data_manager import PsDataManager
 from psPlotKit.data_manager.ps_data import PsData
@@ -1210,3 +1212,531 @@ class TestRegisterDataFile:
         count_after_first = len(dm.PsDataImportInstances)
         dm.load_data()
         assert len(dm.PsDataImportInstances) == count_after_first
+
+
+# ---------- lazy loading ----------
+
+
+class TestLazyLoad:
+    def test_lazy_data_matches_eager(self, loaded_data_manager):
+        """Lazily imported data is read on first access and matches eager import."""
+        dm = PsDataManager(_test_file, lazy_load=True)
+        dm.register_data_key("LCOW", "LCOW", assign_units="USD/m**3")
+        dm.load_data()
+        assert set(dm.keys()) == set(loaded_data_manager.keys())
+        for key in dm.keys():
+            lazy = dict.__getitem__(dm, key)
+            assert lazy.is_loaded is False
+            assert lazy.sunits == "USD/m**3"
+            assert list(lazy.data) == pytest.approx(list(loaded_data_manager[key].data))
+            assert lazy.is_loaded
+
+    def test_memory_budget_releases_oldest(self):
+        """Once the budget is exceeded, the oldest unmodified data is released
+        and re-read on next access."""
+        dm = PsDataManager(_test_file, lazy_load=True, memory_budget=1)
+        dm.register_data_key("LCOW", "LCOW")
+        dm.load_data()
+        first, second = [dict.__getitem__(dm, k) for k in list(dm.keys())[:2]]
+        expected = first.data.copy()
+        second.data
+        assert first.is_loaded is False
+        assert second.is_loaded
+        assert list(first.data) == list(expected)
+        # modified data is never released
+        first.assign_units("USD/m**3")
+        second.data
+        assert first.is_loaded
+
+    def test_no_datasets_retained(self):
+        """Lazy data references datasets by path, open dataset objects are
+        not kept after import."""
+        h5py = pytest.importorskip("h5py")
+
+        def _num_datasets():
+            gc.collect()
+            return sum(isinstance(o, h5py.Dataset) for o in gc.get_objects())
+
+        num_datasets = _num_datasets()
+        dm = PsDataManager(_test_file, lazy_load=True)
+        dm.register_data_key("LCOW", "LCOW")
+        dm.load_data()
+        assert _num_datasets() == num_datasets
+        for key in dm.keys():
+            lazy = dict.__getitem__(dm, key)
+            assert not isinstance(lazy._lazy_source.source, h5py.Dataset)
+            assert len(lazy.data) > 0
+        assert _num_datasets() == num_datasets
+
+
+# ---------- feasibility masks ----------
+
+
+class TestFeasibleMask:
+    def test_mask_shared_within_directory(self):
+        """Feasibility mask is read once per directory and shared by all data."""
+        dm = PsDataManager(_test_file)
+        dm.register_data_key("LCOW", "LCOW")
+        dm.register_data_key(
+            "fs.costing.reverse_osmosis.membrane_cost", "membrane_cost"
+        )
+        dm.load_data()
+        masks = {}
+        for key in dm.keys():
+            directory = key[:-1]
+            mask = dict.__getitem__(dm, key).feasible_indexes
+            assert mask.dtype == bool
+            assert mask.flags.writeable is False
+            masks.setdefault(directory, mask)
+            assert mask is masks[directory]
+        assert len(masks) > 1
+
+
+# ---------- parallel import ----------
+
+
+class TestParallelImport:
+    def _load(self, **kwargs):
+        dm = PsDataManager([_test_file, _test_single_file, _test_file])
+        dm.register_data_key("LCOW", "LCOW")
+        dm.register_data_key("output_c", "output_c")
+        dm.load_data(raise_error=False, **kwargs)
+        return dm
+
+    @pytest.mark.parametrize("parallel_mode", ["thread", "process"])
+    def test_parallel_matches_sequential(self, parallel_mode):
+        """Parallel import merges data in the same order as sequential import."""
+        sequential = self._load()
+        parallel = self._load(num_workers=3, parallel_mode=parallel_mode)
+        assert list(parallel.keys()) == list(sequential.keys())
+        assert parallel.directory_keys == sequential.directory_keys
+        for key in sequential.keys():
+            np.testing.assert_array_equal(parallel[key].data, sequential[key].data)
+
+    def test_parallel_directories_match_sequential(self):
+        """A single file is read with its directories split across threads."""
+        sequential = PsDataManager(_test_file)
+        parallel = PsDataManager(_test_file)
+        for dm in (sequential, parallel):
+            dm.register_data_key("LCOW", "LCOW")
+            dm.register_data_key("fs.costing.reverse_osmosis.membrane_cost", "cost")
+        sequential.load_data()
+        parallel.load_data(num_workers=4)
+        assert list(parallel.keys()) == list(sequential.keys())
+        for key in sequential.keys():
+            np.testing.assert_array_equal(parallel[key].data, sequential[key].data)
+
+    def test_invalid_parallel_mode_raises(self):
+        with pytest.raises(ValueError, match="parallel_mode"):
+            self._load(num_workers=2, parallel_mode="cluster")
+
+
+# ---------- refresh ----------
+
+
+class TestRefresh:
+    def _write_sweep(self, data_file, num_rows, directories):
+        h5py = pytest.importorskip("h5py")
+        with h5py.File(data_file, "a") as f:
+            for d in directories:
+                group = f.require_group("sweep/" + d)
+                for key, offset in [("fs.costing.LCOW", 0.0), ("fs.recovery", 10.0)]:
+                    key_group = group.require_group("outputs/" + key)
+                    if "value" not in key_group:
+                        key_group.create_dataset(
+                            "value", shape=(0,), maxshape=(None,), dtype=float
+                        )
+                        key_group["units"] = b"USD/m**3"
+                    key_group["value"].resize((num_rows,))
+                    key_group["value"][:] = np.arange(num_rows) + offset
+                if "solve_successful" not in group:
+                    group.create_group("solve_successful").create_dataset(
+                        "solve_successful", shape=(0,), maxshape=(None,), dtype=bool
+                    )
+                feasible = group["solve_successful"]["solve_successful"]
+                feasible.resize((num_rows,))
+                feasible[:] = np.arange(num_rows) % 2 == 0
+
+    @pytest.mark.parametrize("lazy_load", [False, True])
+    def test_refresh_reads_new_rows_and_directories(self, tmp_path, lazy_load):
+        data_file = str(tmp_path / "running_sweep_{}.h5".format(lazy_load))
+        self._write_sweep(data_file, 3, ["r_1", "r_2"])
+        dm = PsDataManager(data_file, lazy_load=lazy_load)
+        dm.register_data_key("fs.costing.LCOW", "LCOW", assign_units="USD/m**3")
+        dm.load_data()
+        lcow = dm[("sweep", "r_1"), "LCOW"]
+        assert list(lcow.data) == [0, 1, 2]
+        for instance in dm.PsDataImportInstances:
+            instance.data_file.close()
+        self._write_sweep(data_file, 5, ["r_1", "r_2", "r_3"])
+        dm.refresh()
+        # existing data is updated in place
+        assert dm[("sweep", "r_1"), "LCOW"] is lcow
+        assert list(lcow.data) == [0, 1, 2, 3, 4]
+        assert list(lcow.feasible_indexes) == [True, False, True, False, True]
+        assert lcow.sunits == "USD/m**3"
+        assert list(dm[("sweep", "r_3"), "LCOW"].data) == [
+            0,
+            1,
+            2,
+            3,
+            4,
+        ]
+
+    def test_swmr_poll_reads_rows_while_writing(self, tmp_path):
+        h5py = pytest.importorskip("h5py")
+        data_file = str(tmp_path / "swmr_sweep.h5")
+        writer = h5py.File(data_file, "w", libver="latest")
+        datasets = {}
+        for d in ["r_1", "r_2"]:
+            outputs = writer.create_group("sweep/{}/outputs".format(d))
+            for key in ["fs.costing.LCOW", "fs.recovery"]:
+                datasets[d, key] = outputs.create_dataset(
+                    key + "/value", data=[1.0], maxshape=(None,)
+                )
+        # r_2 recovery has not been written yet
+        datasets["r_2", "fs.recovery"].resize((0,))
+        writer.swmr_mode = True
+        try:
+            dm = PsDataManager(data_file, swmr=True)
+            dm.register_data_key("fs.costing.LCOW", "LCOW")
+            dm.register_data_key("fs.recovery", "recovery")
+            dm.load_data(raise_error=False)
+            assert (("sweep", "r_2"), "recovery") not in dm
+            for dataset in datasets.values():
+                dataset.resize((2,))
+                dataset[:] = [1.0, 2.0]
+                dataset.flush()
+            polled = []
+            dm.poll(interval=0, num_polls=1, callback=polled.append)
+            assert polled == [dm]
+            for d in ["r_1", "r_2"]:
+                for key in ["LCOW", "recovery"]:
+                    assert list(dm[("sweep", d), key].data) == [1.0, 2.0]
+        finally:
+            writer.close()
+
+
+# ---------- row selection ----------
+
+
+class TestRowSelection:
+    def _load(self, rows=None, lazy_load=False, **load_kwargs):
+        dm = PsDataManager(_test_file, lazy_load=lazy_load)
+        dm.register_data_key("LCOW", "LCOW", rows=rows)
+        dm.load_data(**load_kwargs)
+        return dm
+
+    @pytest.mark.parametrize("lazy_load", [False, True])
+    @pytest.mark.parametrize(
+        "rows",
+        [slice(None, None, 3), slice(2, 7), [3, 1, 1, 4]],
+    )
+    def test_rows_match_full_read(self, loaded_data_manager, rows, lazy_load):
+        dm = self._load(rows, lazy_load)
+        for key in loaded_data_manager.keys():
+            full = dict.__getitem__(loaded_data_manager, key)
+            expected_rows = np.arange(len(full.data))[rows]
+            if isinstance(rows, list):
+                expected_rows = np.unique(rows)
+            selected = dict.__getitem__(dm, key)
+            np.testing.assert_array_equal(selected.data, full.data[expected_rows])
+            np.testing.assert_array_equal(
+                selected.feasible_indexes, full.feasible_indexes[expected_rows]
+            )
+
+    def test_load_data_rows_default(self, loaded_data_manager):
+        dm = PsDataManager(_test_file)
+        dm.register_data_key("LCOW", "LCOW")
+        dm.load_data(rows=slice(0, 2))
+        for key in dm.keys():
+            np.testing.assert_array_equal(
+                dm[key].data, loaded_data_manager[key].data[:2]
+            )
+
+    def test_negative_step_raises(self):
+        with pytest.raises(ValueError, match="step"):
+            self._load(slice(None, None, -1))
+
+    @pytest.mark.parametrize("lazy_load", [False, True])
+    def test_empty_rows_import_nothing(self, lazy_load):
+        dm = self._load([], lazy_load, raise_error=False)
+        assert len(dm) == 0
+
+    def test_out_of_range_rows_raise(self):
+        with pytest.raises(ValueError, match="LCOW.*directory.*out of range"):
+            self._load([0, 1000])
+
+    @pytest.mark.parametrize("rows", [None, slice(1, None)])
+    def test_feasible_only(self, loaded_data_manager, rows):
+        dm = PsDataManager(_test_file)
+        dm.register_data_key("LCOW", "LCOW", rows=rows, feasible_only=True)
+        dm.load_data()
+        for key in loaded_data_manager.keys():
+            full = dict.__getitem__(loaded_data_manager, key)
+            expected_rows = np.flatnonzero(full.feasible_indexes)
+            if rows is not None:
+                expected_rows = expected_rows[expected_rows >= 1]
+            compact = dict.__getitem__(dm, key)
+            np.testing.assert_array_equal(compact.row_indexes, expected_rows)
+            np.testing.assert_array_equal(compact.data, full.data[expected_rows])
+            assert compact.feasible_indexes.all()
+
+    def test_feasible_only_drops_infeasible_rows(self, tmp_path):
+        data_file = str(tmp_path / "partly_feasible.h5")
+        TestRefresh()._write_sweep(data_file, 5, ["r_1"])
+        dm = PsDataManager(data_file)
+        dm.register_data_key("fs.costing.LCOW", "LCOW", feasible_only=True)
+        dm.load_data()
+        lcow = dict.__getitem__(dm, "LCOW")
+        assert list(lcow.row_indexes) == [0, 2, 4]
+        assert list(lcow.data) == [0, 2, 4]
+        assert list(lcow.feasible_indexes) == [True, True, True]
+
+    @pytest.mark.parametrize("feasible_only", [False, True])
+    def test_short_feasible_mask_with_rows(self, tmp_path, feasible_only):
+        h5py = pytest.importorskip("h5py")
+        data_file = str(tmp_path / "lagging_mask.h5")
+        TestRefresh()._write_sweep(data_file, 6, ["r_1"])
+        # solve_successful lags behind the data while a sweep is written
+        with h5py.File(data_file, "a") as f:
+            f["sweep/r_1/solve_successful/solve_successful"].resize((3,))
+        dm = PsDataManager(data_file)
+        dm.register_data_key(
+            "fs.costing.LCOW", "LCOW", rows=[1, 2, 4], feasible_only=feasible_only
+        )
+        dm.load_data()
+        lcow = dict.__getitem__(dm, "LCOW")
+        if feasible_only:
+            assert list(lcow.row_indexes) == [2]
+            assert list(lcow.feasible_indexes) == [True]
+        else:
+            assert list(lcow.row_indexes) == [1, 2, 4]
+            assert list(lcow.feasible_indexes) == [False, True, False]
+
+
+# ---------- pickling ----------
+
+
+class TestPickle:
+    def test_loaded_manager_round_trip(self, loaded_data_manager):
+        """Unpickled manager keeps its data and file index, the file is only
+        re-opened when more data is imported."""
+        dm = pickle.loads(pickle.dumps(loaded_data_manager))
+        assert list(dm.keys()) == list(loaded_data_manager.keys())
+        for key in dm.keys():
+            data = dict.__getitem__(dm, key)
+            np.testing.assert_array_equal(
+                data.data, dict.__getitem__(loaded_data_manager, key).data
+            )
+            assert data.sunits == dict.__getitem__(loaded_data_manager, key).sunits
+        (instance,) = dm.PsDataImportInstances
+        assert instance._data_file is None
+        assert instance.directories == (
+            loaded_data_manager.PsDataImportInstances[0].directories
+        )
+        dm.register_data_key(
+            "fs.costing.reverse_osmosis.membrane_cost", "membrane_cost"
+        )
+        dm.load_data()
+        assert instance._data_file is not None
+        assert any(key[-1] == "membrane_cost" for key in dm.keys())
+
+    def test_lazy_data_is_read_after_unpickling(self, loaded_data_manager):
+        dm = PsDataManager(_test_file, lazy_load=True, memory_budget=10**6)
+        dm.register_data_key("LCOW", "LCOW")
+        dm.load_data()
+        loaded_key = list(dm.keys())[0]
+        dm[loaded_key]
+        unpickled = pickle.loads(pickle.dumps(dm))
+        for key in unpickled.keys():
+            data = dict.__getitem__(unpickled, key)
+            assert data.is_loaded is False
+            np.testing.assert_array_equal(
+                data.data, dict.__getitem__(loaded_data_manager, key).data
+            )
+
+    def test_data_views_are_restored(self):
+        data = PsData("LCOW", "outputs", [1.0, 2.0, 3.0], "USD/m**3")
+        data.to_units("USD/L")
+        unpickled = pickle.loads(pickle.dumps(data))
+        np.testing.assert_array_equal(unpickled.data, data.data)
+        assert np.shares_memory(unpickled.data, unpickled.data_with_units)
+        assert str(unpickled.data_with_units.dimensionality) == "USD/L"
+
+
+# ---------- snapshots ----------
+
+
+class TestSnapshot:
+    def _assert_same_data(self, loaded, expected):
+        assert list(loaded.keys()) == list(expected.keys())
+        assert loaded.directory_keys == expected.directory_keys
+        assert loaded.data_keys == expected.data_keys
+        for key in expected.keys():
+            data = dict.__getitem__(loaded, key)
+            expected_data = dict.__getitem__(expected, key)
+            np.testing.assert_array_equal(data.data, expected_data.data)
+            np.testing.assert_array_equal(data.raw_data, expected_data.raw_data)
+            np.testing.assert_array_equal(
+                data.feasible_indexes, expected_data.feasible_indexes
+            )
+            assert data.sunits == expected_data.sunits
+            assert data.data_label == expected_data.data_label
+            assert data.mpl_units == expected_data.mpl_units
+            assert str(data.data_with_units.dimensionality) == str(
+                expected_data.data_with_units.dimensionality
+            )
+
+    def test_round_trip(self, tmp_path):
+        dm = PsDataManager(_test_file, lazy_load=True)
+        dm.register_data_key(
+            "LCOW", "LCOW", assign_units="USD/m**3", units="USD/L", rows=[0, 2, 4]
+        )
+        dm.register_data_key(
+            "fs.costing.reverse_osmosis.membrane_cost", "membrane_cost"
+        )
+        ek = dm.get_expression_keys()
+        dm.register_expression(ek.LCOW * 2, return_key="double_LCOW")
+        dm.load_data()
+        snapshot = str(tmp_path / "campaign.h5")
+        dm.save_snapshot(snapshot)
+        loaded = PsDataManager().load_snapshot(snapshot)
+        self._assert_same_data(loaded, dm)
+        key = next(k for k in loaded.keys() if k[-1] == "LCOW")
+        data = dict.__getitem__(loaded, key)
+        # arrays are read-only views of the snapshot file
+        assert not data.data.flags.writeable
+        assert np.shares_memory(data.data, data.data_with_units)
+        assert list(data.row_indexes) == [0, 2, 4]
+        assert data.to_units("USD/m**3").sunits == "USD/m**3"
+
+    def test_compressed_snapshot(self, tmp_path, loaded_data_manager):
+        snapshot = str(tmp_path / "compressed.h5")
+        loaded_data_manager.save_snapshot(snapshot, compression="gzip")
+        loaded = PsDataManager().load_snapshot(snapshot)
+        self._assert_same_data(loaded, loaded_data_manager)
+
+    def test_not_a_snapshot_raises(self):
+        with pytest.raises(ValueError, match="not a psPlotKit snapshot"):
+            PsDataManager().load_snapshot(_test_file)
+
+
+class TestKeyTable:
+    def test_keys_are_plain_and_strings_cached(self, loaded_data_manager):
+        key = list(loaded_data_manager.keys())[0]
+        # keys are stored as added
+        assert type(key) is tuple
+        key_table = loaded_data_manager._key_table
+        assert key_table.to_str(key) == str(key)
+        assert key_table.to_str(tuple(key)) is key_table.to_str(key)
+        assert key_table.to_str("LCOW") == "LCOW"
+        assert key_table.to_str(["LCOW"]) == str(["LCOW"])
+
+    def test_non_exact_selection_matches_scan(self, loaded_data_manager):
+        dm = loaded_data_manager
+        keys = list(dm.keys())
+        for selected in (["LCOW"], ["pressure_exchanger", "LCOW"], ["erd_type"]):
+            expected = [k for k in keys if all(s in str(k) for s in selected)]
+            assert len(expected) > 0
+            assert dm.select_dir_keys(selected, True, False, False) == expected
+
+    def test_exact_selection_matches_scan(self, loaded_data_manager):
+        def _contains(key, test_key):
+            if key == test_key:
+                return True
+            return isinstance(key, tuple) and any(_contains(k, test_key) for k in key)
+
+        dm = loaded_data_manager
+        keys = list(dm.keys())
+        for selected in (["LCOW"], [keys[0][0]], [keys[0]], ["LCOW", keys[0][0]]):
+            expected = [k for k in keys if all(_contains(k, s) for s in selected)]
+            assert len(expected) > 0
+            assert dm.select_dir_keys(selected, True, True, False) == expected
+        assert dm.select_dir_keys(["not a key"], True, True, False) == []
+
+    def test_pickled_manager_rebuilds_cache(self, loaded_data_manager):
+        expected = loaded_data_manager.select_dir_keys(["LCOW"], True, True)
+        unpickled = pickle.loads(pickle.dumps(loaded_data_manager))
+        assert list(unpickled.keys()) == list(loaded_data_manager.keys())
+        assert unpickled.select_dir_keys(["LCOW"], True, True) == expected
+
+
+class TestStorageDtype:
+    def test_float32_import_matches_float64(self, loaded_data_manager):
+        dm = PsDataManager(_test_file, storage_dtype="float32")
+        dm.register_data_key("LCOW", "LCOW")
+        dm.load_data()
+        for key in loaded_data_manager.keys():
+            data = dict.__getitem__(dm, key)
+            expected = dict.__getitem__(loaded_data_manager, key)
+            assert data.storage_dtype == "float32"
+            assert data.data.dtype == np.float32
+            assert data.data.nbytes * 2 == expected.data.nbytes
+            np.testing.assert_allclose(data.data, expected.data, rtol=1e-6)
+
+    def test_per_key_float16(self, loaded_data_manager):
+        dm = PsDataManager(_test_file, storage_dtype="float32")
+        dm.register_data_key("LCOW", "LCOW", storage_dtype="float16")
+        dm.register_data_key(
+            "fs.costing.reverse_osmosis.membrane_cost", "membrane_cost"
+        )
+        dm.load_data()
+        for key in dm.keys():
+            expected = "float16" if key[-1] == "LCOW" else "float32"
+            assert dm[key].data.dtype == expected
+        for key in loaded_data_manager.keys():
+            np.testing.assert_allclose(
+                dm[key].data, loaded_data_manager[key].data, rtol=1e-3
+            )
+
+    def test_stack_and_expression_keep_dtype(self):
+        dm = PsDataManager(_test_file, storage_dtype="float32")
+        dm.register_data_key("LCOW", "LCOW")
+        ek = dm.get_expression_keys()
+        dm.register_expression(ek.LCOW * 2, return_key="double_LCOW")
+        dm.load_data()
+        dm.generate_data_stack(["erd_type"], "LCOW", None)
+        stacked_keys = [k for k in dm.keys() if k[0] == "stacked_data"]
+        assert ("stacked_data", "membrane_cost", "LCOW") in stacked_keys
+        for key in dm.keys():
+            if key[-1] in ("LCOW", "double_LCOW"):
+                assert dm[key].data.dtype == np.float32
+                assert dm[key].storage_dtype == "float32"
+
+    @pytest.mark.parametrize("lazy_load", [False, True])
+    @pytest.mark.parametrize(
+        "storage_dtype, value, expected",
+        [("float16", 1e6, "float32"), ("float32", 1e300, "float64")],
+    )
+    def test_overflow_keeps_wider_dtype(
+        self, tmp_path, caplog, lazy_load, storage_dtype, value, expected
+    ):
+        h5py = pytest.importorskip("h5py")
+        data_file = str(tmp_path / "overflow.h5")
+        with h5py.File(data_file, "w") as f:
+            key_group = f.create_group("outputs/fs.costing.capex")
+            key_group["value"] = [1.0, value, 3.0]
+            key_group["units"] = b"USD"
+            f["solve_successful/solve_successful"] = [True, True, True]
+        dm = PsDataManager(data_file, lazy_load=lazy_load, storage_dtype=storage_dtype)
+        dm.register_data_key("fs.costing.capex", "capex")
+        dm.load_data()
+        data = dm["capex"]
+        assert data.data.dtype == expected
+        assert data.storage_dtype == expected
+        np.testing.assert_array_equal(data.data, [1.0, value, 3.0])
+        assert "capex" in caplog.text
+
+    def test_snapshot_keeps_dtype(self, tmp_path):
+        dm = PsDataManager(_test_file, storage_dtype="float32")
+        dm.register_data_key("LCOW", "LCOW", assign_units="USD/m**3", units="USD/L")
+        dm.load_data()
+        snapshot = str(tmp_path / "float32.h5")
+        dm.save_snapshot(snapshot)
+        loaded = PsDataManager().load_snapshot(snapshot)
+        for key in dm.keys():
+            data = dict.__getitem__(loaded, key)
+            assert data.storage_dtype == "float32"
+            assert data.data.dtype == np.float32
+            assert data.to_units("USD/m**3").data.dtype == np.float32
@@ -0,0 +1,59 @@
+import pytest
+import difflib
+from psPlotKit.data_manager.ps_key_index import FuzzyKeyIndex
+
+__author__ = "Alexander V. Dudchenko "
+
+_keys = [
+    "fs.costing.LCOW",
+    "fs.costing.reverse_osmosis.membrane_cost",
+    "fs.costing.reverse_osmosis.factor_membrane_replacement",
+    "fs.water_recovery",
+    "fs.product.properties[0.0].flow_vol_phase[Liq]",
+    "fs.RO.area",
+    "fs.RO.feed_side.properties_in[0.0].pressure",
+    "fs.pump.control_volume.work[0.0]",
+]
+
+
+@pytest.fixture
+def key_index():
+    return FuzzyKeyIndex(_keys)
+
+
+@pytest.mark.parametrize(
+    "search_key, n, cutoff",
+    [
+        ("fs.costing.LCOE", 1, 0.6),
+        ("reverse_osmosis.membrane_cost", 3, 0.6),
+        ("fs.costing.reDer_osmosis.membrane_cost", 10, 0.3),
+        ("LCOW_typo", 10, 0.3),
+        ("pump.work", 2, 0.3),
+    ],
+)
+def test_matches_difflib(key_index, search_key, n, cutoff):
+    assert key_index.get_close_matches(
+        search_key, n=n, cutoff=cutoff
+    ) == difflib.get_close_matches(search_key, _keys, n=n, cutoff=cutoff)
+
+
+def test_restrict_to(key_index):
+    allowed = {"fs.RO.area", "fs.water_recovery"}
+    matches = key_index.get_close_matches(
+        "fs.costing.LCOW", n=10, cutoff=0.1, restrict_to=allowed
+    )
+    assert set(matches) <= allowed
+    assert len(matches) > 0
+
+
+def test_shortlist_size():
+    key_index = FuzzyKeyIndex(_keys, shortlist_size=2)
+    candidates = key_index.get_candidates("fs.costing.reverse_osmosis")
+    assert len(candidates) == 2
+    assert all(c.startswith("fs.costing.reverse_osmosis") for c in candidates)
+
+
+def test_unrelated_key_has_no_matches(key_index):
+    assert key_index.get_close_matches("zzzzzzzzzz", n=10, cutoff=0.3) == []
+    assert "fs.RO.area" in key_index
+    assert len(key_index) == len(_keys)
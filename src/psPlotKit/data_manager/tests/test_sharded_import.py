@@ -0,0 +1,98 @@
+import os
+import pickle
+import numpy as np
+import pytest
+from psPlotKit.data_manager.ps_data_manager import PsDataManager
+from psPlotKit.data_manager.sharded_import import ShardedDataImport
+
+__author__ = "Alexander V. Dudchenko "
+
+h5py = pytest.importorskip("h5py")
+
+
+def _write_shard(data_file, rank, directories):
+    with h5py.File(data_file, "w") as f:
+        for d in directories:
+            group = f.create_group("sweep/" + d)
+            values = np.array([rank, rank + 0.5])
+            lcow = group.create_group("outputs/fs.costing.LCOW")
+            lcow.create_dataset("value", data=values)
+            lcow["units"] = b"USD/m**3"
+            group.create_group("solve_successful").create_dataset(
+                "solve_successful", data=[True, rank % 2 == 0]
+            )
+
+
+@pytest.fixture
+def shard_pattern(tmp_path):
+    # rank 10 only has one of the directories
+    for rank in [1, 2, 10]:
+        directories = ["r_1"] if rank == 10 else ["r_1", "r_2"]
+        _write_shard(str(tmp_path / "sweep_rank_{}.h5".format(rank)), rank, directories)
+    return str(tmp_path / "sweep_rank_*.h5")
+
+
+def test_shards_concatenated_in_rank_order(shard_pattern):
+    dm = PsDataManager(shard_pattern)
+    dm.register_data_key("fs.costing.LCOW", "LCOW")
+    dm.load_data()
+    (instance,) = dm.PsDataImportInstances
+    assert [os.path.basename(f) for f in instance.data_location] == [
+        "sweep_rank_1.h5",
+        "sweep_rank_2.h5",
+        "sweep_rank_10.h5",
+    ]
+    lcow = dm[("sweep", "r_1"), "LCOW"]
+    assert list(lcow.data) == [1, 1.5, 2, 2.5, 10, 10.5]
+    assert lcow.sunits == "USD/m**3"
+    assert list(lcow.feasible_indexes) == [True, False, True, True, True, True]
+    assert list(dm[("sweep", "r_2"), "LCOW"].data) == [1, 1.5, 2, 2.5]
+
+
+def test_shard_sort_key(shard_pattern):
+    shards = ShardedDataImport(
+        shard_pattern, sort_key=lambda f: -int(f.split("_")[-1].split(".")[0])
+    )
+    data = shards.get_data(["fs.costing.LCOW"], exact_keys=True)
+    assert list(data[(("sweep", "r_1"),), "fs.costing.LCOW"].data) == [
+        10,
+        10.5,
+        2,
+        2.5,
+        1,
+        1.5,
+    ]
+
+
+def test_missing_shards_raise(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ShardedDataImport(str(tmp_path / "missing_*.h5"))
+
+
+def test_pickled_shards_keep_order(shard_pattern):
+    shards = ShardedDataImport(
+        shard_pattern, sort_key=lambda f: -int(f.split("_")[-1].split(".")[0])
+    )
+    unpickled = pickle.loads(pickle.dumps(shards))
+    assert unpickled.sort_key is None
+    assert unpickled.data_location == shards.data_location
+    data = unpickled.get_data(["fs.costing.LCOW"], exact_keys=True)
+    assert list(data[(("sweep", "r_1"),), "fs.costing.LCOW"].data) == [
+        10,
+        10.5,
+        2,
+        2.5,
+        1,
+        1.5,
+    ]
+
+
+def test_existing_file_with_glob_characters_is_not_sharded(tmp_path):
+    data_file = str(tmp_path / "run[1].h5")
+    _write_shard(data_file, 1, ["r_1"])
+    dm = PsDataManager(data_file)
+    dm.register_data_key("fs.costing.LCOW", "LCOW")
+    dm.load_data()
+    (instance,) = dm.PsDataImportInstances
+    assert not isinstance(instance, ShardedDataImport)
+    assert list(dm["LCOW"].data) == [1.0, 1.5]
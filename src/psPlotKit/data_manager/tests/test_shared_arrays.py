@@ -0,0 +1,95 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from psPlotKit.data_manager.ps_data_manager import PsDataManager
+from psPlotKit.data_manager.shared_arrays import SharedArrayStore, get_shared_reference
+
+__author__ = "Alexander V. Dudchenko "
+
+_this_file_path = os.path.dirname(os.path.abspath(__file__))
+_test_file = os.path.join(_this_file_path, "multi_dir_test.h5")
+
+
+def _summarize(data_manager, key):
+    data = dict.__getitem__(data_manager, key)
+    return (
+        float(np.nansum(data.data)),
+        data.data.flags.writeable,
+        get_shared_reference(data.data) is not None,
+    )
+
+
+def _load(**kwargs):
+    dm = PsDataManager(_test_file, **kwargs)
+    dm.register_data_key("LCOW", "LCOW")
+    dm.load_data()
+    return dm
+
+
+def test_store_views_share_block():
+    with SharedArrayStore() as store:
+        shared = store.share(np.arange(6.0))
+        assert not shared.flags.writeable
+        reference = get_shared_reference(shared[1::2])
+        np.testing.assert_array_equal(reference.attach(), [1.0, 3.0, 5.0])
+        assert len(store) == 1
+    # arrays stay valid in the owning process after blocks are freed
+    assert get_shared_reference(shared) is None
+    assert list(shared) == [0, 1, 2, 3, 4, 5]
+
+
+def test_arrays_are_packed_into_arenas():
+    with SharedArrayStore(arena_size=4096) as store:
+        arrays = [store.share(np.full(10, float(i))) for i in range(200)]
+        large = store.share(np.arange(1000.0))
+        # 32 arrays of 80 bytes, aligned to 64 bytes, fit in each arena,
+        # the large array gets a block of its own
+        assert len(store) == 7 + 1
+        for i, array in enumerate(arrays):
+            assert array.ctypes.data % 64 == 0
+            np.testing.assert_array_equal(
+                get_shared_reference(array).attach(), np.full(10, float(i))
+            )
+        np.testing.assert_array_equal(
+            get_shared_reference(large[::-1]).attach(), np.arange(1000.0)[::-1]
+        )
+    assert get_shared_reference(arrays[0]) is None
+
+
+def test_pickled_data_references_shared_memory():
+    copied = _load()
+    shared = _load(shared_memory=True)
+    key = list(shared.keys())[0]
+    data = dict.__getitem__(shared, key)
+    assert get_shared_reference(data.data_with_units) is not None
+    assert np.shares_memory(data.data, data.data_with_units)
+    unpickled = pickle.loads(pickle.dumps(shared))
+    unpickled_data = dict.__getitem__(unpickled, key)
+    np.testing.assert_array_equal(unpickled_data.data, data.data)
+    assert np.shares_memory(unpickled_data.data, data.data)
+    assert not unpickled_data.data.flags.writeable
+    # only references to the blocks are pickled
+    assert data.data.tobytes() not in pickle.dumps(data)
+    assert data.data.tobytes() in pickle.dumps(dict.__getitem__(copied, key))
+    shared.free_shared_memory()
+    assert get_shared_reference(data.data) is None
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(data)).data, data.data)
+
+
+def test_workers_get_shared_views():
+    copied = _load()
+    dm = _load(lazy_load=True)
+    key = list(copied.keys())[0]
+    # only loaded lazy data is placed in shared memory
+    dict.__getitem__(dm, key).data
+    dm.share_memory()
+    assert len(dm.shared_arrays) > 0
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        total, writeable, is_shared = pool.submit(_summarize, dm, key).result()
+    assert total == pytest.approx(float(np.nansum(copied[key].data)))
+    assert not writeable
+    assert is_shared
+    dm.free_shared_memory()